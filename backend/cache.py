@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable
+
+# Read-through cache for the data layer: bounded LRU with a TTL.
+# Writes invalidate precisely: the touched ids plus every cached listing of that collection.
+# Invalidation is per process: writes from other workers or outside the app are only seen
+# once entries expire, so CACHE_TTL_SECONDS bounds the staleness in a multi-worker deploy.
+# Collection-wide entries ("list" listings, "version" tags) are dropped on every write.
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 10))
+# Larger listings (e.g. full-collection scans) are not worth holding in memory
+CACHE_MAX_LIST_LEN = int(os.getenv("CACHE_MAX_LIST_LEN", 1000))
+# /ai/search results, keyed by the search index's corpus version so writes never serve stale
+# hits; old versions just age out of the LRU
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 512))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", 300))
+
+MISSING = object()
+COLLECTION_KEYS = ("list", "version")
+
+
+def query_key(*parts) -> str:
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def normalize_query(query: str) -> str:
+    # Case and spacing never change what a search matches
+    return " ".join(query.lower().split())
+
+
+class ReadCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires_at, value); keys are ("doc", collection, id), ("list", collection, query)
+        # or ("version", collection)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lists: Dict[str, set] = {}
+        # Bumped on every invalidation; a read that started before a write does not get cached
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, collection: str) -> int:
+        return self._generations.get(collection, 0)
+
+    def put(self, key: Hashable, value: Any, generation: int | None = None):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key[1], 0):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if key[0] in COLLECTION_KEYS:
+                self._lists.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, collection: str, ids: Iterable[Any] = ()):
+        with self._lock:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+            for key in self._lists.pop(collection, set()):
+                self._entries.pop(key, None)
+            for _id in ids:
+                self._entries.pop(("doc", collection, str(_id)), None)
+            self.invalidations += 1
+
+    def invalidate_all(self, collection: str):
+        # For multi-document writes whose ids are not known up front
+        with self._lock:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+            for key in [k for k in self._entries if k[1] == collection]:
+                self._drop(key)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lists.clear()
+
+    def _drop(self, key: Hashable):
+        self._entries.pop(key, None)
+        if key[0] in COLLECTION_KEYS:
+            keys = self._lists.get(key[1])
+            if keys:
+                keys.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+read_cache = ReadCache()
+search_cache = ReadCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS)
@@ -0,0 +1,88 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Note auto-categorization: keyword rules compiled into one regex and matched in a single
+# pass over the note. Rules are ranked in order: the first category with any keyword in
+# the note wins, keywords match anywhere (case-insensitive substrings) and DEFAULT_CATEGORY
+# is the fallback.
+#
+# CATEGORY_RULES_FILE may point at JSON like
+#   {"default": "Personal", "rules": [{"category": "Study", "keywords": ["exam", ...]}, ...]}
+
+DEFAULT_RULES: List[Tuple[str, List[str]]] = [
+    ("Study", ["study", "class", "exam", "lecture"]),
+    ("Work", ["work", "meeting", "project"]),
+    ("Tasks", ["todo", "task", "priority"]),
+    ("Mood", ["feel", "mood", "happy", "sad"]),
+]
+DEFAULT_CATEGORY = "Personal"
+CATEGORY_RULES_FILE = os.getenv("CATEGORY_RULES_FILE")
+
+
+def _trie_pattern(words: Sequence[str]) -> str:
+    # Alternation shaped like a trie (shared prefixes factored out), which re matches far
+    # faster than a flat "a|b|c" once the table grows
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and "" not in node else f"(?:{'|'.join(branches)})"
+        return body + "?" if "" in node else body
+
+    return build(trie)
+
+
+class Categorizer:
+    def __init__(self, rules: Sequence[Tuple[str, Sequence[str]]], default: str = DEFAULT_CATEGORY):
+        self.default = default
+        self.categories = [category for category, _ in rules]
+        ranks: Dict[str, int] = {}
+        for rank, (_, keywords) in enumerate(rules):
+            for k in keywords:
+                if k:
+                    ranks.setdefault(k.lower(), rank)
+        # Each offset reports its longest keyword; every shorter keyword there is a prefix
+        # of it, so fold the best rank among a keyword's prefixes into its own.
+        self._rank = {k: min(r for p, r in ranks.items() if k.startswith(p)) for k in ranks}
+        # Zero-width lookahead tries every offset, so overlapping keywords are all seen
+        self._pattern = re.compile(f"(?=({_trie_pattern(list(ranks))}))") if ranks else None
+
+    def categorize(self, title: str | None, content: str | None) -> str:
+        if self._pattern is None:
+            return self.default
+        best = None
+        for m in self._pattern.finditer(f"{title or ''} {content or ''}".lower()):
+            rank = self._rank[m.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        return self.default if best is None else self.categories[best]
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Categorizer":
+        rules = [(r["category"], list(r.get("keywords", []))) for r in config.get("rules", [])]
+        return cls(rules, config.get("default", DEFAULT_CATEGORY))
+
+
+def load_categorizer(path: str | None = CATEGORY_RULES_FILE) -> Categorizer:
+    if not path:
+        return Categorizer(DEFAULT_RULES)
+    with open(path, encoding="utf-8") as f:
+        return Categorizer.from_config(json.load(f))
+
+
+categorizer = load_categorizer()
+
+
+def categorize(title: str | None, content: str | None) -> str:
+    return categorizer.categorize(title, content)
@@ -1,20 +1,217 @@
 import os
-from typing import Any, Dict, List
+import base64
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Tuple
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING, TEXT, monitoring
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "dear_diary")
 
-_client = MongoClient(DATABASE_URL)
+# Connection pool settings (MongoClient option <- env var). Unset vars keep the driver default.
+# Compressors are tried in order; zstd/snappy need the zstandard/python-snappy packages.
+POOL_ENV = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "compressors": ("MONGO_COMPRESSORS", str),
+    "readPreference": ("MONGO_READ_PREFERENCE", str),
+}
+# Pool sizing is for the async client that serves requests; the sync client only runs
+# startup DDL (ensure_indexes) and scripts, so it keeps the driver's lazy defaults
+POOL_SIZING = ("maxPoolSize", "minPoolSize", "maxIdleTimeMS", "waitQueueTimeoutMS")
+WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS") or os.getenv("MONGO_MIN_POOL_SIZE") or 1)
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters for operators, fed by the driver's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.created = 0
+        self.closed = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for k, v in deltas.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._bump(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._bump(created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(closed=1)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._bump(checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        waited = (time.perf_counter() - getattr(self._local, "started", time.perf_counter())) * 1000
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_ms_total += waited
+            self.wait_ms_max = max(self.wait_ms_max, waited)
+
+    def connection_checked_in(self, event):
+        self._bump(in_use=-1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "in_use": self.in_use,
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+            }
+
+
+def client_options(stats: PoolStats | None = None, pooled: bool = True) -> Dict[str, Any]:
+    opts: Dict[str, Any] = {}
+    for option, (var, cast) in POOL_ENV.items():
+        value = os.getenv(var)
+        if value and (pooled or option not in POOL_SIZING):
+            opts[option] = cast(value)
+    if stats is not None:
+        opts["event_listeners"] = [stats]
+    return opts
+
+
+_client = MongoClient(DATABASE_URL, **client_options(pooled=False))
 db = _client[DATABASE_NAME]
 
+# Newest first, with _id as tie-breaker so keyset pages are stable
+LIST_SORT = [("updated_at", -1), ("_id", -1)]
+
+# Fields covered by each collection's text index (MongoDB allows one per collection)
+TEXT_INDEX_FIELDS = {"note": ["title", "content"]}
+_text_indexed: set = set()
+
+# Index registry: applied idempotently by ensure_indexes() at startup
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 24 * 3600))
+
+INDEXES = {
+    "note": [
+        IndexModel([("folder_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="note_folder_updated"),
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="note_updated"),
+        IndexModel([("tags", ASCENDING)], name="note_tags"),
+    ],
+    "folder": [
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="folder_updated"),
+    ],
+    # Finished jobs (and their stored results) expire after JOB_TTL_SECONDS
+    "job": [
+        IndexModel([("status", ASCENDING)], name="job_status"),
+        IndexModel([("finished_at", ASCENDING)], name="job_finished_ttl", expireAfterSeconds=JOB_TTL_SECONDS),
+    ],
+}
+for _name, _fields in TEXT_INDEX_FIELDS.items():
+    INDEXES.setdefault(_name, []).append(IndexModel([(f, TEXT) for f in _fields], name=f"{_name}_text"))
+
+# Representative queries whose plans should never fall back to a collection scan
+INDEX_PROBES = {
+    "note": [
+        {"filter": {}, "sort": LIST_SORT},
+        {"filter": {"folder_id": ""}, "sort": LIST_SORT},
+        {"filter": {"tags": ""}},
+    ],
+    "folder": [
+        {"filter": {}, "sort": LIST_SORT},
+    ],
+}
+
+index_report: Dict[str, Any] = {}
+
 # Helpers
 
 def _now():
     return datetime.utcnow()
 
 
+def _ensure_text_index(collection_name: str):
+    if collection_name in _text_indexed:
+        return
+    fields = TEXT_INDEX_FIELDS.get(collection_name)
+    if not fields:
+        raise ValueError(f"No text index defined for {collection_name}")
+    # create_index is a no-op when an identical index already exists
+    db[collection_name].create_index([(f, TEXT) for f in fields], name=f"{collection_name}_text")
+    _text_indexed.add(collection_name)
+
+
+def _plan_stages(plan) -> List[str]:
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for v in plan.values():
+            stages += _plan_stages(v)
+        return stages
+    if isinstance(plan, list):
+        return [s for p in plan for s in _plan_stages(p)]
+    return []
+
+
+def ensure_indexes() -> Dict[str, Any]:
+    """Create the registered indexes and report probe queries that still COLLSCAN."""
+    report: Dict[str, Any] = {"indexes": {}, "collscans": []}
+    for collection_name, models in INDEXES.items():
+        report["indexes"][collection_name] = db[collection_name].create_indexes(models)
+    _text_indexed.update(TEXT_INDEX_FIELDS)
+    for collection_name, probes in INDEX_PROBES.items():
+        for probe in probes:
+            cursor = db[collection_name].find(probe["filter"])
+            if probe.get("sort"):
+                cursor = cursor.sort(probe["sort"])
+            plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+            if "COLLSCAN" in _plan_stages(plan):
+                report["collscans"].append({"collection": collection_name, **probe})
+                logger.warning("Query on %s still uses COLLSCAN: %s", collection_name, probe)
+    index_report.clear()
+    index_report.update(report)
+    return report
+
+
+def _text_filter(text: str) -> Dict[str, Any]:
+    # Match the whole query as a phrase, closest to the old substring filter
+    phrase = text.replace('"', " ").strip()
+    return {"$text": {"$search": f'"{phrase}"'}}
+
+
 def create_document(collection_name: str, data: Dict[str, Any]) -> str:
     doc = {**data, "created_at": data.get("created_at") or _now(), "updated_at": data.get("updated_at") or _now()}
     res = db[collection_name].insert_one(doc)
@@ -26,8 +223,17 @@ def update_document(collection_name: str, doc_id, data: Dict[str, Any]):
     db[collection_name].update_one({"_id": ObjectId(doc_id)}, {"$set": {**data, "updated_at": _now()}})
 
 
-def get_documents(collection_name: str, filter_dict: Dict[str, Any] | None = None, limit: int | None = None) -> List[Dict[str, Any]]:
-    cursor = db[collection_name].find(filter_dict or {}).sort("updated_at", -1)
+def _build_filter(collection_name: str, filter_dict: Dict[str, Any] | None, text: str | None) -> Dict[str, Any]:
+    flt = dict(filter_dict or {})
+    if text and text.strip():
+        _ensure_text_index(collection_name)
+        flt.update(_text_filter(text))
+    return flt
+
+
+def get_documents(collection_name: str, filter_dict: Dict[str, Any] | None = None, limit: int | None = None, text: str | None = None, projection: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+    flt = _build_filter(collection_name, filter_dict, text)
+    cursor = db[collection_name].find(flt, projection).sort(LIST_SORT)
     if limit:
         cursor = cursor.limit(limit)
     out = []
@@ -50,3 +256,44 @@ def delete_document(collection_name: str, doc_id: str) -> bool:
     from bson import ObjectId
     res = db[collection_name].delete_one({"_id": ObjectId(doc_id)})
     return res.deleted_count > 0
+
+
+# Keyset pagination over (updated_at, _id). Cursors are opaque to clients.
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    raw = json.dumps({"u": doc["updated_at"].isoformat(), "i": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    from bson import ObjectId
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(raw["u"]), ObjectId(raw["i"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(filter_dict: Dict[str, Any], cursor: str | None) -> Dict[str, Any]:
+    if not cursor:
+        return filter_dict
+    updated_at, _id = decode_cursor(cursor)
+    after = {"$or": [
+        {"updated_at": {"$lt": updated_at}},
+        {"updated_at": updated_at, "_id": {"$lt": _id}},
+    ]}
+    return {"$and": [filter_dict, after]} if filter_dict else after
+
+
+def get_documents_page(collection_name: str, filter_dict: Dict[str, Any] | None = None, limit: int = 50, cursor: str | None = None, text: str | None = None, projection: Dict[str, Any] | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+    """Return (docs, next_cursor); next_cursor is None on the last page."""
+    flt = keyset_filter(_build_filter(collection_name, filter_dict, text), cursor)
+    if projection:
+        projection = {**projection, "updated_at": 1}
+    docs = list(db[collection_name].find(flt, projection).sort(LIST_SORT).limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    out = []
+    for d in docs[:limit]:
+        d["_id"] = str(d["_id"])  # serialize
+        out.append(d)
+    return out, next_cursor
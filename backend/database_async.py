@@ -0,0 +1,303 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+
+from database import (
+    DATABASE_URL, DATABASE_NAME, LIST_SORT, TEXT_INDEX_FIELDS, TEXT, WARMUP_CONNECTIONS,
+    PoolStats, client_options, _text_indexed, _text_filter, _now, keyset_filter, encode_cursor,
+)
+from cache import read_cache, query_key, MISSING, CACHE_MAX_LIST_LEN
+
+# asyncio counterpart of database.py for the FastAPI routes; same API, awaitable.
+# Concurrency is bounded by the driver's connection pool instead of the threadpool.
+
+pool_stats = PoolStats()
+_client = AsyncIOMotorClient(DATABASE_URL, **client_options(pool_stats))
+db = _client[DATABASE_NAME]
+
+# Helpers
+
+def _clone(value):
+    # Callers may mutate what they get back; keep the cached copy private
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(d) for d in value]
+    if isinstance(value, tuple):
+        return (_clone(value[0]),) + value[1:]
+    return value
+
+
+async def _read_through(key: tuple, fetch, cacheable=lambda value: True):
+    cached = read_cache.get(key)
+    if cached is not MISSING:
+        return _clone(cached)
+    generation = read_cache.generation(key[1])
+    value = await fetch()
+    if cacheable(value):
+        read_cache.put(key, _clone(value), generation)
+    return value
+
+
+# Per-collection counters bumped by writes that keep updated_at, so versions still move
+WRITE_COUNTERS = "write_counter"
+
+
+async def _count_write(collection_name: str):
+    await db[WRITE_COUNTERS].update_one({"_id": collection_name}, {"$inc": {"writes": 1}}, upsert=True)
+
+
+async def collection_version(collection_name: str) -> str:
+    """Version of the collection's contents, for ETags: document count, the newest
+    updated_at / _id (one seek on the listing index) and the collection's write counter,
+    which covers the writes that leave updated_at alone (derived fields, counters).
+
+    Taken from the database rather than the read cache's invalidation counters, which only
+    see writes made by this process: tags agree across workers and change on outside writes.
+    The value itself is read-through cached like the listings it validates, so writes from
+    this process show at once and others within CACHE_TTL_SECONDS.
+    """
+    async def fetch():
+        coll = db[collection_name]
+        newest, count, counter = await asyncio.gather(
+            coll.find({}, {"updated_at": 1}).sort(LIST_SORT).limit(1).to_list(length=1),
+            coll.estimated_document_count(),
+            db[WRITE_COUNTERS].find_one({"_id": collection_name}),
+        )
+        writes = counter["writes"] if counter else 0
+        if not newest:
+            return f"{count}-{writes}"
+        ts = newest[0].get("updated_at")
+        stamp = ts.strftime("%Y%m%d%H%M%S%f") if ts else "0"
+        return f"{count}-{stamp}-{newest[0]['_id']}-{writes}"
+
+    return await _read_through(("version", collection_name), fetch)
+
+
+async def warmup_pool(connections: int = WARMUP_CONNECTIONS) -> Dict[str, Any]:
+    """Open connections up front so the first requests after a deploy skip the handshake."""
+    # Concurrent pings each need their own pooled connection
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, connections))))
+    return pool_stats.snapshot()
+
+
+async def _build_filter(collection_name: str, filter_dict: Dict[str, Any] | None, text: str | None) -> Dict[str, Any]:
+    flt = dict(filter_dict or {})
+    if text and text.strip():
+        if collection_name not in _text_indexed:
+            fields = TEXT_INDEX_FIELDS.get(collection_name)
+            if not fields:
+                raise ValueError(f"No text index defined for {collection_name}")
+            await db[collection_name].create_index([(f, TEXT) for f in fields], name=f"{collection_name}_text")
+            _text_indexed.add(collection_name)
+        flt.update(_text_filter(text))
+    return flt
+
+
+async def create_document(collection_name: str, data: Dict[str, Any]) -> str:
+    doc = {**data, "created_at": data.get("created_at") or _now(), "updated_at": data.get("updated_at") or _now()}
+    res = await db[collection_name].insert_one(doc)
+    read_cache.invalidate(collection_name)
+    return str(res.inserted_id)
+
+
+async def update_document(collection_name: str, doc_id, data: Dict[str, Any]):
+    from bson import ObjectId
+    await db[collection_name].update_one({"_id": ObjectId(doc_id)}, {"$set": {**data, "updated_at": _now()}})
+    read_cache.invalidate(collection_name, [doc_id])
+
+
+async def get_documents(collection_name: str, filter_dict: Dict[str, Any] | None = None, limit: int | None = None, text: str | None = None, projection: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+    async def fetch():
+        flt = await _build_filter(collection_name, filter_dict, text)
+        cursor = db[collection_name].find(flt, projection).sort(LIST_SORT)
+        if limit:
+            cursor = cursor.limit(limit)
+        out = []
+        async for d in cursor:
+            d["_id"] = str(d["_id"])  # serialize
+            out.append(d)
+        return out
+
+    key = ("list", collection_name, query_key(filter_dict, limit, text, projection))
+    return await _read_through(key, fetch, lambda docs: len(docs) <= CACHE_MAX_LIST_LEN)
+
+
+async def get_documents_page(collection_name: str, filter_dict: Dict[str, Any] | None = None, limit: int = 50, cursor: str | None = None, text: str | None = None, projection: Dict[str, Any] | None = None) -> Tuple[List[Dict[str, Any]], str | None]:
+    """Return (docs, next_cursor); next_cursor is None on the last page."""
+    if projection:
+        projection = {**projection, "updated_at": 1}
+
+    async def fetch():
+        flt = keyset_filter(await _build_filter(collection_name, filter_dict, text), cursor)
+        docs = await db[collection_name].find(flt, projection).sort(LIST_SORT).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        out = []
+        for d in docs[:limit]:
+            d["_id"] = str(d["_id"])  # serialize
+            out.append(d)
+        return out, next_cursor
+
+    key = ("list", collection_name, query_key("page", filter_dict, limit, cursor, text, projection))
+    return await _read_through(key, fetch)
+
+
+async def iter_documents(collection_name: str, filter_dict: Dict[str, Any] | None = None, projection: Dict[str, Any] | None = None, batch_size: int = 1000):
+    """Stream every match off the cursor, batch_size at a time; bypasses the read cache."""
+    cursor = db[collection_name].find(filter_dict or {}, projection).sort(LIST_SORT).batch_size(batch_size)
+    async for d in cursor:
+        d["_id"] = str(d["_id"])  # serialize
+        yield d
+
+
+async def count_documents(collection_name: str, filter_dict: Dict[str, Any] | None = None) -> int:
+    """Uncached count; the whole collection's comes from its metadata."""
+    if not filter_dict:
+        return await db[collection_name].estimated_document_count()
+    return await db[collection_name].count_documents(filter_dict)
+
+
+async def get_document(collection_name: str, doc_id: str) -> Dict[str, Any] | None:
+    from bson import ObjectId
+
+    async def fetch():
+        d = await db[collection_name].find_one({"_id": ObjectId(doc_id)})
+        if not d:
+            return None
+        d["_id"] = str(d["_id"])  # serialize
+        return d
+
+    return await _read_through(("doc", collection_name, str(doc_id)), fetch, lambda d: d is not None)
+
+
+async def find_document(collection_name: str, doc_id: str, projection: Dict[str, Any] | None = None) -> Dict[str, Any] | None:
+    """get_document without the read cache, for documents too large or too short-lived to hold."""
+    from bson import ObjectId
+    if not ObjectId.is_valid(doc_id):
+        return None
+    d = await db[collection_name].find_one({"_id": ObjectId(doc_id)}, projection)
+    if d:
+        d["_id"] = str(d["_id"])
+    return d
+
+
+async def delete_document(collection_name: str, doc_id: str) -> bool:
+    from bson import ObjectId
+    res = await db[collection_name].delete_one({"_id": ObjectId(doc_id)})
+    read_cache.invalidate(collection_name, [doc_id])
+    return res.deleted_count > 0
+
+
+async def update_documents_where(collection_name: str, filter_dict: Dict[str, Any], data: Dict[str, Any]) -> int:
+    res = await db[collection_name].update_many(filter_dict, {"$set": {**data, "updated_at": _now()}})
+    read_cache.invalidate_all(collection_name)
+    return res.modified_count
+
+
+async def set_document_fields(collection_name: str, updates: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """$set derived fields on many documents in one bulk_write; updated_at is left alone."""
+    if not updates:
+        return 0
+    from bson import ObjectId
+    res = await db[collection_name].bulk_write([UpdateOne({"_id": ObjectId(doc_id)}, {"$set": data}) for doc_id, data in updates], ordered=False)
+    await _count_write(collection_name)
+    read_cache.invalidate(collection_name, [doc_id for doc_id, _ in updates])
+    return res.modified_count
+
+
+async def apply_counters(collection_name: str, updates: List[Tuple[str, Dict[str, int], Dict[str, Any]]]) -> int:
+    """One bulk_write of {"$inc": inc, "$max": max} per (id, inc, max); updated_at is left alone."""
+    from bson import ObjectId
+    ops = []
+    for doc_id, inc, mx in updates:
+        update = {k: v for k, v in (("$inc", inc), ("$max", mx)) if v}
+        if update:
+            ops.append(UpdateOne({"_id": ObjectId(doc_id)}, update))
+    if not ops:
+        return 0
+    res = await db[collection_name].bulk_write(ops, ordered=False)
+    await _count_write(collection_name)
+    read_cache.invalidate(collection_name, [doc_id for doc_id, _, _ in updates])
+    return res.modified_count
+
+
+async def aggregate(collection_name: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return await db[collection_name].aggregate(pipeline).to_list(length=None)
+
+
+# Bulk writes: one unordered bulk_write per call, with a result per input item.
+
+def _object_id(doc_id):
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    try:
+        return ObjectId(doc_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+async def _bulk_write(collection_name: str, ops: List[Any]) -> Dict[int, str]:
+    """Run ops unordered; return {op index: error message} for the ops that failed."""
+    if not ops:
+        return {}
+    try:
+        await db[collection_name].bulk_write(ops, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        if e.details.get("writeConcernErrors"):
+            raise
+        return {err["index"]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+
+
+async def _existing_ids(collection_name: str, oids: List[Any]) -> set:
+    cursor = db[collection_name].find({"_id": {"$in": oids}}, {"_id": 1})
+    return {d["_id"] async for d in cursor}
+
+
+def _result(doc_id, error: str | None) -> Dict[str, Any]:
+    return {"id": str(doc_id), "ok": False, "error": error} if error else {"id": str(doc_id), "ok": True}
+
+
+async def create_documents(collection_name: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    from bson import ObjectId
+    now = _now()
+    docs = [{**data, "_id": ObjectId(), "created_at": data.get("created_at") or now, "updated_at": data.get("updated_at") or now} for data in items]
+    errors = await _bulk_write(collection_name, [InsertOne(d) for d in docs])
+    read_cache.invalidate(collection_name)
+    return [_result(d["_id"], errors.get(i)) for i, d in enumerate(docs)]
+
+
+async def _write_existing(collection_name: str, ids: List[str], make_op) -> List[Dict[str, Any]]:
+    oids = [_object_id(doc_id) for doc_id in ids]
+    found = await _existing_ids(collection_name, [o for o in oids if o])
+    ops, positions, results = [], {}, []
+    for i, (doc_id, oid) in enumerate(zip(ids, oids)):
+        if oid is None or oid not in found:
+            results.append(_result(doc_id, "Invalid id" if oid is None else "Not found"))
+            continue
+        positions[len(ops)] = i
+        ops.append(make_op(i, oid))
+        results.append(_result(doc_id, None))
+    try:
+        errors = await _bulk_write(collection_name, ops)
+    finally:
+        read_cache.invalidate(collection_name, ids)
+    for op_index, error in errors.items():
+        i = positions[op_index]
+        results[i] = _result(ids[i], error)
+    return results
+
+
+async def update_documents(collection_name: str, updates: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    now = _now()
+    return await _write_existing(
+        collection_name,
+        [doc_id for doc_id, _ in updates],
+        lambda i, oid: UpdateOne({"_id": oid}, {"$set": {**updates[i][1], "updated_at": now}}),
+    )
+
+
+async def delete_documents(collection_name: str, ids: List[str]) -> List[Dict[str, Any]]:
+    return await _write_existing(collection_name, ids, lambda i, oid: DeleteOne({"_id": oid}))
@@ -0,0 +1,109 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from database_async import apply_counters, aggregate, iter_documents, set_document_fields
+from database import _now
+
+logger = logging.getLogger(__name__)
+
+# Per-folder note counters, kept on the folder document so GET /folders?with_counts=1 is
+# still a single query:
+#   "counts": {"notes": int, "last_updated_at": datetime, "categories": {category: int}}
+# Note writes adjust them with $inc/$max (no read-modify-write). They are not written in
+# the same transaction as the note, and last_updated_at is not lowered when notes leave,
+# so reconcile() rebuilds everything from a $group over the notes.
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def empty_counts() -> Dict[str, Any]:
+    # last_updated_at is left out until a note lands, so $max always has a date to compare
+    return {"notes": 0, "categories": {}}
+
+
+class CounterDeltas:
+    """Counter changes for a set of note writes, flushed as one bulk_write over the folders."""
+
+    def __init__(self):
+        self._inc: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._max: Dict[str, Any] = {}
+
+    def _bump(self, note: Dict[str, Any], n: int):
+        folder_id = note.get("folder_id")
+        if not folder_id:
+            return
+        self._inc[folder_id]["counts.notes"] += n
+        if note.get("category"):
+            self._inc[folder_id][f"counts.categories.{note['category']}"] += n
+
+    def change(self, before: Dict[str, Any] | None, after: Dict[str, Any] | None):
+        """Record a note going from before to after (None for create / delete)."""
+        if before:
+            self._bump(before, -1)
+        if after:
+            self._bump(after, 1)
+            if after.get("folder_id"):
+                self._max[after["folder_id"]] = _now()
+
+    async def flush(self):
+        from bson import ObjectId
+        folders = set(self._inc) | set(self._max)
+        updates = [
+            (folder_id, {k: v for k, v in self._inc.get(folder_id, {}).items() if v}, {"counts.last_updated_at": self._max[folder_id]} if folder_id in self._max else {})
+            for folder_id in folders
+            if ObjectId.is_valid(folder_id)
+        ]
+        self._inc.clear()
+        self._max.clear()
+        try:
+            await apply_counters("folder", updates)
+        except Exception as e:
+            # The note write already happened; reconcile() repairs the drift
+            logger.error("Folder counter update failed: %s", e)
+
+
+async def record_changes(changes: List[tuple]):
+    deltas = CounterDeltas()
+    for before, after in changes:
+        deltas.change(before, after)
+    await deltas.flush()
+
+
+async def reconcile() -> Dict[str, int]:
+    """Recompute every folder's counters from the notes themselves."""
+    rows = await aggregate("note", [
+        {"$match": {"folder_id": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": {"folder_id": "$folder_id", "category": "$category"},
+            "notes": {"$sum": 1},
+            "last_updated_at": {"$max": "$updated_at"},
+        }},
+    ])
+    counts: Dict[str, Dict[str, Any]] = defaultdict(empty_counts)
+    for row in rows:
+        c = counts[row["_id"]["folder_id"]]
+        c["notes"] += row["notes"]
+        if row["_id"].get("category"):
+            c["categories"][row["_id"]["category"]] = row["notes"]
+        last = row["last_updated_at"]
+        if last and (c.get("last_updated_at") is None or last > c["last_updated_at"]):
+            c["last_updated_at"] = last
+    folders = notes = 0
+    batch = []
+    async for folder in iter_documents("folder", {}, {"_id": 1}, batch_size=RECONCILE_BATCH_SIZE):
+        c = counts.get(folder["_id"]) or empty_counts()
+        batch.append((folder["_id"], {"counts": c}))
+        folders += 1
+        notes += c["notes"]
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            await set_document_fields("folder", batch)
+            batch = []
+    await set_document_fields("folder", batch)
+    return {"folders": folders, "notes": notes}
+
+
+def counts_out(folder: Dict[str, Any]) -> Dict[str, Any]:
+    c = {**empty_counts(), "last_updated_at": None, **(folder.get("counts") or {})}
+    c["categories"] = {k: v for k, v in c["categories"].items() if v}
+    return c
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from database_async import create_document, find_document, update_document, update_documents_where
+from database import _now
+
+logger = logging.getLogger(__name__)
+
+# In-process background jobs for slow endpoints. Jobs are persisted in the "job" collection
+# so their status and results can be polled; the queue itself lives in this process.
+#
+# Several processes share the collection, so each stamps its jobs with an owner id and
+# keeps a heartbeat on the ones still queued or running. A job whose heartbeat is older
+# than JOB_LEASE_SECONDS lost its process (and inputs) and is failed by whichever process
+# notices first; jobs of live processes are left alone.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 100))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 120))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# handler(params) -> (JSON result, optional file bytes)
+Handler = Callable[[Dict[str, Any]], Awaitable[Tuple[Dict[str, Any], bytes | None]]]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Handler] = {}
+        self._cleanup: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._queue: asyncio.Queue | None = None
+        self._reserved = 0
+        self._tasks: list = []
+        # dedup key -> id of the queued or running job with that key
+        self._inflight: Dict[str, str] = {}
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+
+    @property
+    def kinds(self):
+        return tuple(self._handlers)
+
+    def register(self, kind: str, handler: Handler, cleanup: Callable[[Dict[str, Any]], None] | None = None):
+        """cleanup(params) runs once a job of this kind is finished or dropped (e.g. temp files)."""
+        self._handlers[kind] = handler
+        if cleanup:
+            self._cleanup[kind] = cleanup
+
+    async def start(self):
+        # Bounded by submit() (queued + reserved <= max_queued), so put_nowait never fails
+        self._queue = asyncio.Queue()
+        await self._expire()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, params: Dict[str, Any], dedup_key: str | None = None) -> Tuple[str, bool]:
+        """Queue a job; returns (job id, created). An identical job still in flight is reused."""
+        from bson import ObjectId
+        if dedup_key and dedup_key in self._inflight:
+            self.deduplicated += 1
+            self._drop(kind, params)
+            return self._inflight[dedup_key], False
+        if self._queue is None or self._queue.qsize() + self._reserved >= self.max_queued:
+            self.rejected += 1
+            self._drop(kind, params)
+            raise JobQueueFull("Job queue is full, retry later")
+        # Slot and dedup key are claimed before the insert so concurrent submits see them
+        job_id = str(ObjectId())
+        self._reserved += 1
+        if dedup_key:
+            self._inflight[dedup_key] = job_id
+        try:
+            await create_document("job", {"_id": ObjectId(job_id), "kind": kind, "status": QUEUED, "params": params, "dedup_key": dedup_key, "owner": self.owner, "heartbeat_at": _now()})
+        except Exception:
+            if dedup_key:
+                self._inflight.pop(dedup_key, None)
+            self._drop(kind, params)
+            raise
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait((job_id, kind, params, dedup_key))
+        self.submitted += 1
+        return job_id, True
+
+    async def get(self, job_id: str, with_file: bool = False) -> Dict[str, Any] | None:
+        # Not through the read cache: it would pin result files in memory, and status
+        # polls only need the file when the result itself is fetched
+        return await find_document("job", job_id, None if with_file else {"file": 0})
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await update_documents_where("job", {"owner": self.owner, "status": {"$in": [QUEUED, RUNNING]}}, {"heartbeat_at": _now()})
+                await self._expire()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+    async def _expire(self):
+        # Jobs from before owners were recorded have no heartbeat and count as expired
+        cutoff = _now() - timedelta(seconds=JOB_LEASE_SECONDS)
+        self.expired += await update_documents_where(
+            "job",
+            {"status": {"$in": [QUEUED, RUNNING]}, "owner": {"$ne": self.owner}, "heartbeat_at": {"$not": {"$gte": cutoff}}},
+            {"status": FAILED, "error": "Interrupted: the process running it stopped", "finished_at": _now()},
+        )
+
+    async def _worker(self):
+        while True:
+            job_id, kind, params, dedup_key = await self._queue.get()
+            try:
+                await update_document("job", job_id, {"status": RUNNING, "started_at": _now()})
+                result, file = await self._handlers[kind](params)
+                await update_document("job", job_id, {"status": DONE, "result": result, "file": file, "has_file": file is not None, "finished_at": _now()})
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job_id, kind)
+                self.failed += 1
+                try:
+                    await update_document("job", job_id, {"status": FAILED, "error": str(e), "finished_at": _now()})
+                except Exception:
+                    logger.exception("Could not record failure of job %s", job_id)
+            finally:
+                if dedup_key:
+                    self._inflight.pop(dedup_key, None)
+                self._drop(kind, params)
+                self._queue.task_done()
+
+    def _drop(self, kind: str, params: Dict[str, Any]):
+        cleanup = self._cleanup.get(kind)
+        if cleanup:
+            try:
+                cleanup(params)
+            except Exception:
+                logger.exception("Cleanup of a %s job failed", kind)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queued": self.max_queued,
+            "in_flight": len(self._inflight),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "owner": self.owner,
+        }
+
+
+def job_out(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Inputs (temp paths etc.) and stored file bytes stay server-side
+    out = {k: doc.get(k) for k in ("_id", "kind", "status", "error", "created_at", "started_at", "finished_at")}
+    if doc.get("status") == DONE:
+        out["result"] = doc.get("result")
+        out["has_file"] = bool(doc.get("has_file"))
+    return out
+
+
+job_queue = JobQueue()
@@ -1,14 +1,32 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Tuple
 from datetime import datetime
 
-from database import db, create_document, get_documents, get_document, update_document, delete_document
-from schemas import Note, Folder, NoteCreate, NoteUpdate, FolderCreate, AISuggestRequest, AIIdeaRequest, SearchRequest, ExportRequest
+from database import ensure_indexes, index_report
+from database_async import (
+    db, pool_stats, warmup_pool, collection_version, create_document, get_documents, get_documents_page, get_document, iter_documents, update_document, delete_document,
+    count_documents, create_documents, update_documents, delete_documents, set_document_fields,
+)
+from schemas import Note, Folder, NoteCreate, NoteUpdate, FolderCreate, AISuggestRequest, AIIdeaRequest, SearchRequest, ExportRequest, PDFJobRequest, NoteBatchCreate, NoteBatchUpdate, NoteBatchDelete
 
 # Simple in-app AI stubs using basic heuristics so the UI flows; can be replaced with real LLMs/embeddings later
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from search_engine import note_engine, RANKERS
+from vector_store import note_vectors
+from categorizer import categorize
+import folder_counts
+from cache import read_cache, search_cache, normalize_query, MISSING
+from transcription import receive_audio, get_transcriber, stash_audio, remove_stashed, UploadTooLarge
+from jobs import job_queue, job_out, JobQueueFull, DONE
+from pdf_render import pdf_cache, cached_pdf, render_pdf, render_notes_pdf, pdf_filename, content_disposition, stream_zip, shutdown_pool
+
+logger = logging.getLogger(__name__)
+transcriber = get_transcriber()
 
 app = FastAPI(title="Dear Diary API")
 
@@ -18,6 +36,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # -------- Utility AI helpers (local heuristics) --------
@@ -61,63 +80,249 @@ def idea_generator(mode: str, topic: str | None) -> List[str]:
 
 # -------- API Routes --------
 
+@app.on_event("startup")
+async def startup():
+    try:
+        await run_in_threadpool(ensure_indexes)
+    except Exception as e:
+        logger.error("Index setup failed: %s", e)
+    try:
+        await warmup_pool()
+    except Exception as e:
+        logger.error("Connection pool warmup failed: %s", e)
+    try:
+        await job_queue.start()
+        # Folders from before the counters existed get them built once
+        if await get_documents("folder", {"counts": {"$exists": False}}, limit=1):
+            await job_queue.submit("reconcile_folder_counts", {}, "reconcile_folder_counts")
+    except Exception as e:
+        logger.error("Job queue startup failed: %s", e)
+    global index_sync
+    if INDEX_SYNC_SECONDS > 0:
+        index_sync = asyncio.create_task(sync_note_indexes())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if index_sync is not None:
+        index_sync.cancel()
+    await job_queue.stop()
+    shutdown_pool()
+    index_writer.shutdown(wait=True)
+    note_engine.stop_maintenance()
+    note_vectors.close()
+
 @app.get("/health")
 def health():
     return {"ok": True, "time": datetime.utcnow().isoformat()}
 
+@app.get("/stats")
+def stats():
+    return {"pool": pool_stats.snapshot(), "cache": read_cache.stats(), "search_cache": search_cache.stats(), "pdf": pdf_cache.stats(), "jobs": job_queue.stats(), "vectors": note_vectors.stats()}
+
 # Folders
 @app.post("/folders", response_model=Dict[str, str])
-def create_folder(folder: FolderCreate):
-    folder_id = create_document("folder", folder.model_dump())
+async def create_folder(folder: FolderCreate):
+    folder_id = await create_document("folder", {**folder.model_dump(), "counts": folder_counts.empty_counts()})
     return {"id": folder_id}
 
+# Keyset pages: ?limit=N[&cursor=...]; the next page's cursor comes back in X-Next-Cursor
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+async def list_page(response: Response, collection: str, flt: Dict[str, Any], limit: int | None, cursor: str | None, **kwargs) -> List[Dict[str, Any]]:
+    if limit is None and cursor is None:
+        return await get_documents(collection, flt, **kwargs)
+    try:
+        docs, next_cursor = await get_documents_page(collection, flt, limit or DEFAULT_PAGE_SIZE, cursor, **kwargs)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
+
+# Conditional GETs: weak ETags from the collection's version. A matching
+# If-None-Match gets a 304 before the listing is queried or anything is serialized.
+async def not_modified(request: Request, response: Response, collection: str) -> Response | None:
+    etag = f'W/"{await collection_version(collection)}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    # Weak comparison: W/ prefixes are ignored on both sides
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
 @app.get("/folders", response_model=List[Dict[str, Any]])
-def list_folders():
-    return get_documents("folder")
+async def list_folders(request: Request, response: Response, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None, with_counts: bool = False):
+    unchanged = await not_modified(request, response, "folder")
+    if unchanged:
+        return unchanged
+    # Counters live on the folder documents, so this stays one query either way
+    folders = await list_page(response, "folder", {}, limit, cursor)
+    for f in folders:
+        counts = f.pop("counts", None)
+        if with_counts:
+            f["counts"] = folder_counts.counts_out({"counts": counts})
+    return folders
+
+# Search index writes run on one dedicated thread, in submission order, and requests do not
+# wait for them: a write only queues its notes (one batch per request). Searches wait for
+# the queue to drain first (index_barrier), so they still see every write before them.
+index_writer = ThreadPoolExecutor(1, thread_name_prefix="index-writes")
+
+def _index_notes(added: List[Tuple[str, str, str]], removed: List[str]):
+    if added:
+        note_engine.add_many(added)
+        note_vectors.add_many(added)
+    if removed:
+        note_engine.remove_many(removed)
+        note_vectors.remove_many(removed)
+
+def _index_failed(future):
+    if future.exception() is not None:
+        logger.error("Search index update failed: %s", future.exception())
+
+def index_notes(added: List[Tuple[str, str, str]] = (), removed: List[str] = ()):
+    if added or removed:
+        index_writer.submit(_index_notes, list(added), list(removed)).add_done_callback(_index_failed)
+
+async def index_barrier():
+    await asyncio.get_running_loop().run_in_executor(index_writer, lambda: None)
 
 # Notes CRUD
 @app.post("/notes", response_model=Dict[str, str])
-def create_note(note: NoteCreate):
-    # Auto-categorize simple heuristic
-    text = (note.title + " " + note.content).lower()
-    category = (
-        "Study" if any(k in text for k in ["study", "class", "exam", "lecture"]) else
-        "Work" if any(k in text for k in ["work", "meeting", "project"]) else
-        "Tasks" if any(k in text for k in ["todo", "task", "priority"]) else
-        "Mood" if any(k in text for k in ["feel", "mood", "happy", "sad"]) else
-        "Personal"
-    )
-    data = {**note.model_dump(), "category": category}
-    note_id = create_document("note", data)
+async def create_note(note: NoteCreate):
+    data = {**note.model_dump(), "category": categorize(note.title, note.content)}
+    note_id = await create_document("note", data)
+    index_notes([(note_id, note.title, note.content)])
+    await folder_counts.record_changes([(None, data)])
     return {"id": note_id}
 
+# Batch endpoints: one unordered bulk_write per request, one result per item.
+# Declared before /notes/{note_id} so "batch" is not taken for an id.
+@app.post("/notes/batch")
+async def create_notes_batch(batch: NoteBatchCreate):
+    items = [{**n.model_dump(), "category": categorize(n.title, n.content)} for n in batch.items]
+    results = await create_documents("note", items)
+    index_notes([(r["id"], note.title, note.content) for note, r in zip(batch.items, results) if r["ok"]])
+    await folder_counts.record_changes([(None, data) for data, r in zip(items, results) if r["ok"]])
+    return {"results": results}
+
+async def notes_by_id(ids: List[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+    from bson import ObjectId
+    oids = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+    if not oids:
+        return {}
+    return {d["_id"]: d for d in await get_documents("note", {"_id": {"$in": oids}}, projection={f: 1 for f in fields})}
+
+@app.patch("/notes/batch")
+async def update_notes_batch(batch: NoteBatchUpdate):
+    updates = [(item.id, item.model_dump(exclude={"id"}, exclude_none=True)) for item in batch.items]
+    # Current state: text changes re-derive the category, folder counters need the old folder
+    current = await notes_by_id([doc_id for doc_id, _ in updates], ["title", "content", "folder_id", "category"])
+    for doc_id, data in updates:
+        if doc_id in current and ("title" in data or "content" in data):
+            merged = {**current[doc_id], **data}
+            data["category"] = categorize(merged.get("title", ""), merged.get("content", ""))
+    results = await update_documents("note", updates)
+    changes, reindex = [], []
+    for r, (doc_id, data) in zip(results, updates):
+        if r["ok"] and doc_id in current:
+            merged = {**current[doc_id], **data}
+            changes.append((current[doc_id], merged))
+            if "title" in data or "content" in data:
+                reindex.append((doc_id, merged.get("title", ""), merged.get("content", "")))
+    index_notes(reindex)
+    await folder_counts.record_changes(changes)
+    return {"results": results}
+
+@app.delete("/notes/batch")
+async def remove_notes_batch(batch: NoteBatchDelete):
+    current = await notes_by_id(batch.ids, ["folder_id", "category"])
+    results = await delete_documents("note", batch.ids)
+    index_notes(removed=[r["id"] for r in results if r["ok"]])
+    await folder_counts.record_changes([(current[r["id"]], None) for r in results if r["ok"] and r["id"] in current])
+    return {"results": results}
+
+# Listing projections: ?fields=title,tags or ?view=summary (preview instead of full content)
+NOTE_FIELDS = ["title", "content", "folder_id", "tags", "tone", "category", "is_pinned", "created_at", "updated_at"]
+SUMMARY_FIELDS = ["title", "folder_id", "tags", "category", "is_pinned", "created_at", "updated_at", "preview"]
+PREVIEW_LEN = 200
+
+def note_projection(fields: str | None, view: str) -> Dict[str, Any] | None:
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip() and f.strip() != "_id"]
+        unknown = set(selected) - set(NOTE_FIELDS) - {"preview"}
+        if unknown:
+            raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    elif view == "summary":
+        selected = SUMMARY_FIELDS
+    elif view == "full":
+        return None
+    else:
+        raise HTTPException(400, f"Unknown view: {view}")
+    proj: Dict[str, Any] = {f: 1 for f in selected if f != "preview"}
+    if "preview" in selected:
+        # Truncated server-side so the full content never leaves Mongo
+        content = {"$ifNull": ["$content", ""]}
+        proj["preview"] = {"$substrCP": [content, 0, PREVIEW_LEN]}
+        proj["preview_truncated"] = {"$gt": [{"$strLenCP": content}, PREVIEW_LEN]}
+    return proj
+
 @app.get("/notes", response_model=List[Dict[str, Any]])
-def get_notes(folder_id: str | None = None, q: str | None = None):
+async def get_notes(request: Request, response: Response, folder_id: str | None = None, q: str | None = None, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None, fields: str | None = None, view: str = "full"):
     flt: Dict[str, Any] = {}
     if folder_id:
         flt["folder_id"] = folder_id
-    notes = get_documents("note", flt)
-    if q:
-        notes = [n for n in notes if q.lower() in (n.get("title", "") + " " + n.get("content", "")).lower()]
+    projection = note_projection(fields, view)
+    unchanged = await not_modified(request, response, "note")
+    if unchanged:
+        return unchanged
+    # q, sort and limit all run in Mongo against the note text index
+    notes = await list_page(response, "note", flt, limit, cursor, text=q, projection=projection)
+    if projection and "preview" in projection:
+        for n in notes:
+            if n.pop("preview_truncated", False):
+                n["preview"] += "…"
     return notes
 
 @app.get("/notes/{note_id}", response_model=Dict[str, Any])
-def get_note(note_id: str):
-    doc = get_document("note", note_id)
+async def get_note(note_id: str, request: Request, response: Response):
+    unchanged = await not_modified(request, response, "note")
+    if unchanged:
+        return unchanged
+    doc = await get_document("note", note_id)
     if not doc:
         raise HTTPException(404, "Note not found")
     return doc
 
 @app.patch("/notes/{note_id}")
-def update_note(note_id: str, payload: NoteUpdate):
-    update_document("note", note_id, {k: v for k, v in payload.model_dump(exclude_none=True).items()})
+async def update_note(note_id: str, payload: NoteUpdate):
+    data = {k: v for k, v in payload.model_dump(exclude_none=True).items()}
+    doc = await get_document("note", note_id)
+    if doc and ("title" in data or "content" in data):
+        merged = {**doc, **data}
+        data["category"] = categorize(merged.get("title", ""), merged.get("content", ""))
+    await update_document("note", note_id, data)
+    if doc:
+        merged = {**doc, **data}
+        if "title" in data or "content" in data:
+            index_notes([(note_id, merged.get("title", ""), merged.get("content", ""))])
+        await folder_counts.record_changes([(doc, merged)])
     return {"ok": True}
 
 @app.delete("/notes/{note_id}")
-def remove_note(note_id: str):
-    ok = delete_document("note", note_id)
+async def remove_note(note_id: str):
+    doc = await get_document("note", note_id)
+    ok = await delete_document("note", note_id)
     if not ok:
         raise HTTPException(404, "Note not found")
+    index_notes(removed=[note_id])
+    if doc:
+        await folder_counts.record_changes([(doc, None)])
     return {"ok": True}
 
 # AI rewrite
@@ -130,51 +335,252 @@ def ai_rewrite(req: AISuggestRequest):
 def ai_ideas(req: AIIdeaRequest):
     return {"ideas": idea_generator(req.mode, req.topic)}
 
-# AI semantic search using TF-IDF per-request (demo level)
+# The search engine is built from the collection on first use, streamed off a cursor
+INDEXED_NOTE_FIELDS = {"title": 1, "content": 1, "updated_at": 1}
+
+async def ensure_note_engine():
+    await note_engine.ensure_loaded(lambda: iter_documents("note", {}, INDEXED_NOTE_FIELDS))
+
+# Semantic search vectors persist across restarts (see vector_store); the load scan only
+# re-embeds notes that are new or changed since, and drops rows of deleted ones
+async def ensure_note_vectors():
+    await note_vectors.ensure_loaded(lambda: iter_documents("note", {}, INDEXED_NOTE_FIELDS))
+
+# Note writes made by other workers reach the loaded indexes through a periodic sync, run
+# whenever the collection version has moved (see LiveIndex.sync). 0 turns it off.
+INDEX_SYNC_SECONDS = float(os.getenv("INDEX_SYNC_SECONDS", 10))
+index_sync: asyncio.Task | None = None
+
+def changed_notes(since: datetime):
+    return iter_documents("note", {"updated_at": {"$gte": since}}, INDEXED_NOTE_FIELDS)
+
+async def sync_note_indexes():
+    synced = None
+    while True:
+        await asyncio.sleep(INDEX_SYNC_SECONDS)
+        try:
+            version = await collection_version("note")
+            if version == synced:
+                continue
+            for index in (note_engine, note_vectors):
+                await index.sync(changed_notes, lambda: count_documents("note"), lambda: iter_documents("note", {}, {"_id": 1}))
+            synced = version
+        except Exception as e:
+            logger.error("Search index sync failed: %s", e)
+
+# AI search: TF-IDF / BM25 over the long-lived engine, or embeddings ("semantic").
+# Ranking and snippets run in the threadpool, next to index writes and maintenance.
+SEARCH_RANKERS = RANKERS + ("semantic",)
+
+def rank_notes(req: SearchRequest) -> Tuple[List[Tuple[str, float]], Dict[str, float]]:
+    if req.ranker == "semantic":
+        return note_vectors.search(req.query, req.limit), dict.fromkeys(note_engine.analyze(req.query), 1.0)
+    weights = note_engine.query_weights(req.query, req.fuzzy)
+    if req.ranker == "bm25":
+        return note_engine.search_bm25(weights, req.limit), weights
+    return note_engine.search(weights, req.limit), weights
+
+def search_results(ranked: List[Tuple[str, float]], docs: Dict[str, Dict[str, Any]], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+    results = []
+    for i, s in ranked:
+        if i in docs:
+            # The snippet stands in for the note body
+            note = docs[i]
+            content = note.pop("content", "")
+            results.append({"note": note, "score": s, **note_engine.highlight(i, weights, note.get("title"), content)})
+    return results
+
 @app.post("/ai/search")
-def ai_search(req: SearchRequest):
-    docs = get_documents("note")
-    corpus = [d.get("title", "") + " " + d.get("content", "") for d in docs]
-    if not corpus:
-        return {"results": []}
-    vectorizer = TfidfVectorizer(stop_words="english")
-    X = vectorizer.fit_transform(corpus + [req.query])
-    sims = cosine_similarity(X[-1], X[:-1]).flatten()
-    ranked = sorted(zip(docs, sims), key=lambda x: x[1], reverse=True)[: req.limit]
-    return {"results": [{"note": d, "score": float(s)} for d, s in ranked]}
+async def ai_search(req: SearchRequest):
+    from bson import ObjectId
+    if req.ranker not in SEARCH_RANKERS:
+        raise HTTPException(400, f"Unknown ranker: {req.ranker}")
+    await index_barrier()
+    if req.ranker == "semantic":
+        await ensure_note_vectors()
+    else:
+        await ensure_note_engine()
+    # Repeats between note writes are served from the result cache. Results embed the note
+    # documents, so the collection generation is part of the version too.
+    index = note_vectors if req.ranker == "semantic" else note_engine
+    key = ("search", index.version, read_cache.generation("note"), req.ranker, req.fuzzy, req.limit, normalize_query(req.query))
+    cached = search_cache.get(key)
+    if cached is not MISSING:
+        return {"results": cached}
+    ranked, weights = await run_in_threadpool(rank_notes, req)
+    docs = {d["_id"]: d for d in await get_documents("note", {"_id": {"$in": [ObjectId(i) for i, _ in ranked]}})} if ranked else {}
+    results = await run_in_threadpool(search_results, ranked, docs, weights)
+    search_cache.put(key, results)
+    return {"results": results}
 
 # Voice transcription stub (accepts audio file but returns placeholder)
+async def receive_upload(request: Request):
+    # Accepts a multipart "file" field or a raw audio body; never held in memory whole
+    try:
+        return await receive_audio(request.headers.get("content-type", ""), request.headers.get("content-length"), request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(413, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
 @app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
-    # Stub: real implementation would use Whisper or external ASR
-    content = await file.read()
-    seconds = max(1, len(content) // 32000)
-    return {"text": f"Transcribed {seconds}s of audio (demo)", "language": "en"}
+async def transcribe(request: Request):
+    audio = await receive_upload(request)
+    try:
+        return await run_in_threadpool(transcriber.transcribe, audio)
+    finally:
+        audio.close()
 
 # Export PDF stub
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from io import BytesIO
 from fastapi.responses import StreamingResponse
 
+async def note_pdf(note_id: str, note: Dict[str, Any]) -> bytes:
+    title = note.get("title", "Untitled")
+    return await cached_pdf((note_id, str(note.get("updated_at")), title), render_pdf, title, note.get("content", ""))
+
 @app.post("/export/pdf")
-def export_pdf(req: ExportRequest):
-    note = get_document("note", req.note_id)
+async def export_pdf(req: ExportRequest):
+    note = await get_document("note", req.note_id)
     if not note:
         raise HTTPException(404, "Note not found")
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.setFont("Times-Roman", 14)
-    c.drawString(72, 750, note.get("title", "Untitled"))
-    textobject = c.beginText(72, 720)
-    textobject.setFont("Times-Roman", 11)
-    for line in note.get("content", "").splitlines():
-        textobject.textLine(line)
-    c.drawText(textobject)
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={note.get('title','note')}.pdf"})
+    pdf = await note_pdf(req.note_id, note)
+    return StreamingResponse(BytesIO(pdf), media_type="application/pdf", headers={"Content-Disposition": content_disposition(f"{note.get('title', 'note')}.pdf")})
+
+# Whole-folder export: one multi-page PDF, or a ZIP with a PDF per note that is
+# rendered in parallel and streamed entry by entry as renders finish. The single PDF is
+# one render held in memory, so it is only offered up to FOLDER_PDF_MAX_NOTES notes.
+FOLDER_EXPORT_FORMATS = ("pdf", "zip")
+FOLDER_PDF_MAX_NOTES = int(os.getenv("FOLDER_PDF_MAX_NOTES", 200))
+
+async def zip_entries(notes):
+    async for note in notes:
+        title = note.get("title", "Untitled")
+        # Same cache key as /export/pdf, so notes exported one by one are reused
+        yield pdf_filename(title, note["_id"]), (note["_id"], str(note.get("updated_at")), title), title, note.get("content", "")
+
+@app.get("/export/folder/{folder_id}")
+async def export_folder(folder_id: str, format: str = "pdf"):
+    if format not in FOLDER_EXPORT_FORMATS:
+        raise HTTPException(400, f"Unknown format: {format}")
+    folder = await get_document("folder", folder_id)
+    if not folder:
+        raise HTTPException(404, "Folder not found")
+    notes = iter_documents("note", {"folder_id": folder_id}, {"title": 1, "content": 1, "updated_at": 1})
+    filename = pdf_filename(folder.get("name"), folder_id)[:-len(".pdf")]
+    if format == "zip":
+        return StreamingResponse(stream_zip(zip_entries(notes)), media_type="application/zip", headers={"Content-Disposition": content_disposition(f"{filename}.zip")})
+    docs = []
+    async for n in notes:
+        docs.append(n)
+        if len(docs) > FOLDER_PDF_MAX_NOTES:
+            raise HTTPException(400, f"Folder has more than {FOLDER_PDF_MAX_NOTES} notes; export it with format=zip")
+    pages = [(n.get("title", "Untitled"), n.get("content", "")) for n in docs] or [(folder.get("name", "Untitled"), "")]
+    key = ("folder", folder_id) + tuple((n["_id"], str(n.get("updated_at")), p[0]) for n, p in zip(docs, pages))
+    pdf = await cached_pdf(key, render_notes_pdf, pages)
+    return StreamingResponse(BytesIO(pdf), media_type="application/pdf", headers={"Content-Disposition": content_disposition(f"{filename}.pdf")})
+
+# Background jobs: POST /jobs/{kind} answers 202 with an id to poll at GET /jobs/{id};
+# identical in-flight jobs are shared and a full queue answers 429.
+async def transcribe_job(params: Dict[str, Any]):
+    def run():
+        with open(params["path"], "rb") as audio:
+            return transcriber.transcribe(audio)
+    return await run_in_threadpool(run), None
+
+async def export_pdf_job(params: Dict[str, Any]):
+    note = await get_document("note", params["note_id"])
+    if not note:
+        raise ValueError("Note not found")
+    pdf = await note_pdf(params["note_id"], note)
+    filename = pdf_filename(note.get("title", "Untitled"), params["note_id"])
+    return {"media_type": "application/pdf", "filename": filename, "size": len(pdf)}, pdf
+
+# Re-derives every note's category (e.g. after CATEGORY_RULES_FILE changes), reading the
+# collection off one cursor and writing only the changed notes, a bulk_write per batch
+RECATEGORIZE_BATCH_SIZE = int(os.getenv("RECATEGORIZE_BATCH_SIZE", 1000))
+
+async def recategorize_job(params: Dict[str, Any]):
+    scanned = updated = 0
+    changes, deltas = [], folder_counts.CounterDeltas()
+    async for note in iter_documents("note", {}, {"title": 1, "content": 1, "category": 1, "folder_id": 1}, batch_size=RECATEGORIZE_BATCH_SIZE):
+        scanned += 1
+        category = categorize(note.get("title", ""), note.get("content", ""))
+        if category != note.get("category"):
+            changes.append((note["_id"], {"category": category}))
+            deltas.change(note, {"folder_id": note.get("folder_id"), "category": category})
+        if len(changes) >= RECATEGORIZE_BATCH_SIZE:
+            updated += await set_document_fields("note", changes)
+            await deltas.flush()
+            changes = []
+    updated += await set_document_fields("note", changes)
+    await deltas.flush()
+    return {"scanned": scanned, "updated": updated}, None
+
+async def reconcile_folder_counts_job(params: Dict[str, Any]):
+    return await folder_counts.reconcile(), None
+
+job_queue.register("transcribe", transcribe_job, cleanup=remove_stashed)
+job_queue.register("export_pdf", export_pdf_job)
+job_queue.register("recategorize", recategorize_job)
+job_queue.register("reconcile_folder_counts", reconcile_folder_counts_job)
+
+@app.post("/jobs/{kind}", status_code=202)
+async def submit_job(kind: str, request: Request, response: Response):
+    if kind == "transcribe":
+        audio = await receive_upload(request)
+        try:
+            path, digest = await run_in_threadpool(stash_audio, audio)
+        finally:
+            audio.close()
+        params, dedup_key = {"path": path}, f"transcribe:{digest}"
+    elif kind == "export_pdf":
+        try:
+            req = PDFJobRequest.model_validate(await request.json())
+        except ValueError:
+            raise HTTPException(400, 'Expected a JSON body like {"note_id": "..."}')
+        note = await get_document("note", req.note_id)
+        if not note:
+            raise HTTPException(404, "Note not found")
+        params, dedup_key = {"note_id": req.note_id}, f"export_pdf:{req.note_id}:{note.get('updated_at')}"
+    else:
+        raise HTTPException(404, f"Unknown job kind: {kind}")
+    return await enqueue(response, kind, params, dedup_key)
+
+async def enqueue(response: Response, kind: str, params: Dict[str, Any], dedup_key: str | None) -> Dict[str, Any]:
+    try:
+        job_id, created = await job_queue.submit(kind, params, dedup_key)
+    except JobQueueFull as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": "5"})
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"id": job_id, "created": created}
+
+@app.post("/admin/recategorize", status_code=202)
+async def recategorize_notes(response: Response):
+    return await enqueue(response, "recategorize", {}, "recategorize")
+
+@app.post("/admin/reconcile-folder-counts", status_code=202)
+async def reconcile_folder_counts(response: Response):
+    return await enqueue(response, "reconcile_folder_counts", {}, "reconcile_folder_counts")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job_out(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await job_queue.get(job_id, with_file=True)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    if job["status"] != DONE:
+        raise HTTPException(409, f"Job is {job['status']}")
+    result = job.get("result") or {}
+    if job.get("file") is not None:
+        return Response(job["file"], media_type=result.get("media_type", "application/octet-stream"), headers={"Content-Disposition": content_disposition(result.get("filename", "result"))})
+    return result
 
 # Google Docs / Notion export stubs
 @app.post("/export/gdoc")
@@ -187,9 +593,9 @@ def export_notion(req: ExportRequest):
 
 # Test DB
 @app.get("/test")
-def test_db():
+async def test_db():
     try:
-        db.list_collection_names()
-        return {"ok": True}
+        await db.list_collection_names()
+        return {"ok": True, "indexes": index_report}
     except Exception as e:
         return {"ok": False, "error": str(e)}
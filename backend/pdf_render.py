@@ -0,0 +1,277 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import unicodedata
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from urllib.parse import quote
+from typing import Any, AsyncIterable, Dict, Hashable, List, Tuple
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# PDF export: rendering runs in a process pool (reportlab is pure Python and CPU bound),
+# and finished files are kept in a byte-bounded LRU keyed by (note_id, updated_at, title).
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 72
+TITLE_FONT, TITLE_SIZE, TITLE_LEADING = "Times-Roman", 14, 18
+BODY_FONT, BODY_SIZE, BODY_LEADING = "Times-Roman", 11, 13
+
+
+def _fit(word: str, font: str, size: float, width: float) -> int:
+    # Longest prefix of word that fits in width (at least one character)
+    lo, hi = 1, len(word)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if stringWidth(word[:mid], font, size) <= width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def wrap_text(text: str, font: str, size: float, width: float) -> List[str]:
+    """Wrap on spaces by rendered width; words wider than a line are broken."""
+    space = stringWidth(" ", font, size)
+    lines = []
+    for para in (text or "").expandtabs(4).splitlines() or [""]:
+        line, line_width = "", 0.0
+        for word in para.split(" "):
+            word_width = stringWidth(word, font, size)
+            if line and line_width + space + word_width <= width:
+                line, line_width = f"{line} {word}", line_width + space + word_width
+                continue
+            if line:
+                lines.append(line)
+            while word_width > width:
+                cut = _fit(word, font, size, width)
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = stringWidth(word, font, size)
+            line, line_width = word, word_width
+        lines.append(line)
+    return lines
+
+
+def _draw_note(c: canvas.Canvas, title: str, content: str):
+    text_width = PAGE_WIDTH - 2 * MARGIN
+    y = PAGE_HEIGHT - MARGIN
+    c.setFont(TITLE_FONT, TITLE_SIZE)
+    for line in wrap_text(title, TITLE_FONT, TITLE_SIZE, text_width):
+        c.drawString(MARGIN, y, line)
+        y -= TITLE_LEADING
+    y -= 4  # a little air under the title
+    c.setFont(BODY_FONT, BODY_SIZE)
+    for line in wrap_text(content, BODY_FONT, BODY_SIZE, text_width):
+        if y < MARGIN:
+            c.showPage()
+            c.setFont(BODY_FONT, BODY_SIZE)
+            y = PAGE_HEIGHT - MARGIN
+        c.drawString(MARGIN, y, line)
+        y -= BODY_LEADING
+    c.showPage()
+
+
+def render_pdf(title: str, content: str) -> bytes:
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    _draw_note(c, title, content)
+    c.save()
+    return buffer.getvalue()
+
+
+def render_notes_pdf(notes: List[Tuple[str, str]]) -> bytes:
+    """One document, each (title, content) starting on a new page."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for title, content in notes:
+        _draw_note(c, title, content)
+    c.save()
+    return buffer.getvalue()
+
+
+def pdf_filename(title: str, note_id: str) -> str:
+    safe = re.sub(r"[^\w\- ]+", "", title or "").strip()[:60] or "note"
+    return f"{safe}-{note_id[-6:]}.pdf"
+
+
+def content_disposition(filename: str) -> str:
+    # Header values are Latin-1: an ASCII fallback in filename=, the real (Unicode) name
+    # percent-encoded in filename*= (RFC 6266 / 5987)
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode()
+    fallback = re.sub(r"[^\w\-. ]+", "", fallback).strip()
+    if not fallback[:1].isalnum():
+        # Nothing readable survived before the id / extension
+        fallback = "download" + ("" if fallback[:1] in ("-", ".") else "-" * bool(fallback)) + fallback
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+class PdfCache:
+    def __init__(self, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key: Hashable, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = pdf
+            self.size += len(pdf)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+pdf_cache = PdfCache()
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+# key -> future of a render already in flight, so concurrent clicks share one render
+_inflight: Dict[Hashable, asyncio.Future] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor | None:
+    global _pool
+    if PDF_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that holds driver threads and sockets is unsafe
+            _pool = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def _run(fn, *args) -> bytes:
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool and retry once
+        with _pool_lock:
+            _pool = None
+        return await loop.run_in_executor(_get_pool(), fn, *args)
+
+
+async def cached_pdf(key: Hashable, fn, *args) -> bytes:
+    """Return the cached PDF for key, rendering fn(*args) off the event loop on a miss."""
+    pdf = pdf_cache.get(key)
+    if pdf is not None:
+        return pdf
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future = asyncio.ensure_future(_run(fn, *args))
+    _inflight[key] = future
+    try:
+        pdf = await asyncio.shield(future)
+    finally:
+        _inflight.pop(key, None)
+    pdf_cache.put(key, pdf)
+    return pdf
+
+
+class _ZipSink:
+    # Write-only, non-seekable target for ZipFile; bytes are handed out as they are written
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _named(name: str, render) -> Tuple[str, bytes]:
+    return name, await render
+
+
+async def stream_zip(notes: AsyncIterable[Tuple[str, Hashable, str, str]], window: int = PDF_WORKERS * 2):
+    """Yield a ZIP of one PDF per (filename, cache key, title, content), rendering up to
+    window notes in parallel and writing each entry as soon as its render finishes."""
+    sink = _ZipSink()
+    # PDFs are already compressed; storing them keeps zlib off the event loop
+    zf = zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED)
+    pending: set = set()
+    window = max(1, window)
+
+    async def write_finished():
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            pending.discard(task)
+            name, pdf = task.result()
+            zf.writestr(name, pdf)
+
+    try:
+        async for name, key, title, content in notes:
+            pending.add(asyncio.ensure_future(_named(name, cached_pdf(key, render_pdf, title, content))))
+            if len(pending) >= window:
+                await write_finished()
+                yield sink.take()
+        while pending:
+            await write_finished()
+            yield sink.take()
+        zf.close()
+        yield sink.take()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -40,6 +40,8 @@ class AIIdeaRequest(BaseModel):
 class SearchRequest(BaseModel):
     query: str
     limit: int = 20
+    ranker: str = "tfidf"  # tfidf, bm25, semantic
+    fuzzy: bool = True  # match misspelled terms against similar indexed ones
 
 class NoteCreate(BaseModel):
     title: str
@@ -56,6 +58,21 @@ class NoteUpdate(BaseModel):
     tone: Optional[str] = None
     is_pinned: Optional[bool] = None
 
+# Batch note endpoints (one bulk_write per request)
+MAX_BATCH_SIZE = 5000
+
+class NoteBatchCreate(BaseModel):
+    items: List[NoteCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NoteBatchUpdateItem(NoteUpdate):
+    id: str
+
+class NoteBatchUpdate(BaseModel):
+    items: List[NoteBatchUpdateItem] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NoteBatchDelete(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
 class FolderCreate(BaseModel):
     name: str
     icon: str = "📁"
@@ -63,3 +80,6 @@ class FolderCreate(BaseModel):
 class ExportRequest(BaseModel):
     note_id: str
     format: str  # pdf, gdoc, notion
+
+class PDFJobRequest(BaseModel):
+    note_id: str
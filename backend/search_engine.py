@@ -0,0 +1,406 @@
+import re
+import zlib
+from collections import Counter
+from typing import Any, List, Tuple, Dict
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from live_index import LiveIndex, grow
+from snippets import token_starts, highlight_spans, make_snippet
+from trigram_index import TrigramIndex
+
+# Long-lived TF-IDF engine behind /ai/search.
+#
+# Raw term counts live in a CSC document-term matrix (the "main" segment) plus a small
+# append-only "delta" of rows written since the last merge. IDF weights and per-row norms
+# are cached and only refreshed after enough writes to move them, so a query is a column
+# slice over its own terms and one sparse dot product instead of a fit over the corpus.
+# Merges and refreshes run on the maintenance thread (see LiveIndex), not in the write.
+#
+# The same segments also hold field-weighted counts for BM25, which is ranked term at a
+# time with MaxScore pruning so common query terms only score documents still in the race.
+#
+# Query terms no live note contains are matched fuzzily against the vocabulary through a
+# trigram index, weighted by their similarity.
+#
+# Each row also keeps its content as a stream of (term column, start offset) pairs, so a
+# hit's snippet is the window around its matches, cut without re-tokenizing the note.
+
+# BM25 parameters; title hits count double by default
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+
+RANKERS = ("tfidf", "bm25")
+
+# TfidfVectorizer's default token pattern
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+class TfidfSearchEngine(LiveIndex):
+    def __init__(
+        self,
+        merge_ratio: float = 0.1,
+        min_merge: int = 64,
+        refresh_ratio: float = 0.05,
+        k1: float = K1,
+        b: float = B,
+        title_weight: float = TITLE_WEIGHT,
+        content_weight: float = CONTENT_WEIGHT,
+    ):
+        super().__init__()
+        # Same tokenization/stop words the per-request vectorizer used
+        self._stop_words = TfidfVectorizer(stop_words="english").get_stop_words()
+        self._merge_ratio = merge_ratio
+        self._min_merge = min_merge
+        self._refresh_ratio = refresh_ratio
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.content_weight = content_weight
+
+        self._vocab: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._df: List[int] = []
+        # Terms with df > 0
+        self._trigrams = TrigramIndex()
+        self._idf = np.zeros(0)
+
+        # Rows are append-only; updates mark the old row dead and append a new one
+        self._ids: List[str | None] = []
+        self._row_of: Dict[str, int] = {}
+        self._cols: List[np.ndarray] = []
+        self._tfs: List[np.ndarray] = []
+        self._wtfs: List[np.ndarray] = []
+        # Content token stream per row, and a checksum of the content it came from
+        self._pos_cols: List[np.ndarray] = []
+        self._pos_starts: List[np.ndarray] = []
+        self._crcs = np.zeros(0, dtype=np.uint32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0)
+        self._lengths = np.zeros(0)
+
+        self._main = sp.csc_matrix((0, 0))
+        self._main_bm25 = sp.csc_matrix((0, 0))
+        self._main_max_wtf = np.zeros(0)
+        self._delta: sp.csc_matrix | None = None
+        self._delta_bm25: sp.csc_matrix | None = None
+        self._n_live = 0
+        self._total_length = 0.0
+        self._min_length = np.inf
+        self._writes_since_refresh = 0
+
+    @property
+    def _n_rows(self) -> int:
+        return len(self._ids)
+
+    @property
+    def _n_main(self) -> int:
+        return self._main.shape[0]
+
+    def __len__(self):
+        return self._n_live
+
+    # -------- writes --------
+
+    def _after_load(self):
+        self._rebuild()
+
+    def _maintenance_due(self) -> bool:
+        return self._merge_due() or self._refresh_due()
+
+    def _maintain(self):
+        with self._lock:
+            if self._merge_due():
+                self._rebuild()
+            else:
+                self._maybe_refresh()
+
+    def analyze(self, text: str) -> List[str]:
+        return [term for term, _ in self._tokens(text)]
+
+    def _tokens(self, text: str) -> List[Tuple[str, int]]:
+        return [(term, start) for term, start in token_starts(text, TOKEN_RE) if term not in self._stop_words]
+
+    def _add(self, doc_id: str, title: str, content: str):
+        self._remove(doc_id)
+        title_tokens = self.analyze(title)
+        content_stream = self._tokens(content)
+        content_tokens = [term for term, _ in content_stream]
+        title_counts = Counter(title_tokens)
+        content_counts = Counter(content_tokens)
+        terms = title_counts.keys() | content_counts.keys()
+        cols = np.empty(len(terms), dtype=np.int32)
+        tfs = np.empty(len(terms), dtype=np.float64)
+        wtfs = np.empty(len(terms), dtype=np.float64)
+        for i, term in enumerate(terms):
+            col = self._vocab.get(term)
+            if col is None:
+                col = self._vocab[term] = len(self._df)
+                self._terms.append(term)
+                self._df.append(0)
+            if not self._df[col]:
+                self._trigrams.add(term)
+            self._df[col] += 1
+            cols[i] = col
+            tt, ct = title_counts.get(term, 0), content_counts.get(term, 0)
+            tfs[i] = tt + ct
+            wtfs[i] = self.title_weight * tt + self.content_weight * ct
+        length = self.title_weight * len(title_tokens) + self.content_weight * len(content_tokens)
+        self._n_live += 1
+        self._total_length += length
+        self._min_length = min(self._min_length, length)
+        self._extend_idf()
+
+        row = self._n_rows
+        self._ids.append(doc_id)
+        self._row_of[doc_id] = row
+        self._cols.append(cols)
+        self._tfs.append(tfs)
+        self._wtfs.append(wtfs)
+        self._pos_cols.append(np.fromiter((self._vocab[term] for term in content_tokens), dtype=np.int32, count=len(content_tokens)))
+        self._pos_starts.append(np.fromiter((start for _, start in content_stream), dtype=np.int32, count=len(content_stream)))
+        self._crcs = grow(self._crcs, row + 1)
+        self._crcs[row] = zlib.crc32(content.encode())
+        self._alive = grow(self._alive, row + 1)
+        self._norms = grow(self._norms, row + 1)
+        self._lengths = grow(self._lengths, row + 1)
+        self._alive[row] = True
+        self._norms[row] = np.linalg.norm(tfs * self._idf[cols])
+        self._lengths[row] = length
+        self._delta = None
+        self._delta_bm25 = None
+        self._writes_since_refresh += 1
+
+    def _remove(self, doc_id: str):
+        row = self._row_of.pop(doc_id, None)
+        if row is None:
+            return
+        for col in self._cols[row]:
+            self._df[col] -= 1
+            if not self._df[col]:
+                self._trigrams.remove(self._terms[col])
+        self._ids[row] = None
+        self._alive[row] = False
+        self._n_live -= 1
+        self._total_length -= self._lengths[row]
+        self._writes_since_refresh += 1
+
+    # -------- cached weights / segments --------
+
+    def _idf_for(self, df: np.ndarray) -> np.ndarray:
+        # smooth_idf as in TfidfVectorizer
+        return np.log((1 + self._n_live) / (1 + df)) + 1
+
+    def _extend_idf(self):
+        known = len(self._idf)
+        if known < len(self._df):
+            self._idf = np.concatenate([self._idf, self._idf_for(np.asarray(self._df[known:]))])
+
+    def _refresh_weights(self):
+        self._idf = self._idf_for(np.asarray(self._df, dtype=np.float64))
+        idf2 = self._idf ** 2
+        norms = np.zeros(self._n_rows)
+        if self._n_main:
+            norms[: self._n_main] = np.sqrt(self._main.power(2) @ idf2[: self._main.shape[1]])
+        for row in range(self._n_main, self._n_rows):
+            norms[row] = np.sqrt(np.dot(self._tfs[row] ** 2, idf2[self._cols[row]]))
+        self._norms = norms
+        self._writes_since_refresh = 0
+
+    def _refresh_due(self) -> bool:
+        return self._writes_since_refresh > self._refresh_ratio * max(self._n_live, 1)
+
+    def _maybe_refresh(self):
+        if self._refresh_due():
+            self._refresh_weights()
+
+    def _merge_due(self) -> bool:
+        pending = self._n_rows - self._n_main
+        dead = self._n_rows - self._n_live
+        return pending > max(self._min_merge, self._merge_ratio * self._n_main) or dead > max(self._min_merge, self._n_live // 4)
+
+    def _rebuild(self):
+        # Fold the delta into main and drop dead rows
+        keep = [r for r in range(self._n_rows) if self._alive[r]]
+        self._ids = [self._ids[r] for r in keep]
+        self._cols = [self._cols[r] for r in keep]
+        self._tfs = [self._tfs[r] for r in keep]
+        self._wtfs = [self._wtfs[r] for r in keep]
+        self._pos_cols = [self._pos_cols[r] for r in keep]
+        self._pos_starts = [self._pos_starts[r] for r in keep]
+        self._crcs = self._crcs[keep]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._lengths = self._lengths[keep]
+        self._min_length = self._lengths.min() if keep else np.inf
+        self._main = _rows_to_csc(self._cols, self._tfs, len(self._df))
+        self._main_bm25 = _rows_to_csc(self._cols, self._wtfs, len(self._df))
+        if self._main_bm25.shape[0] and self._main_bm25.shape[1]:
+            self._main_max_wtf = self._main_bm25.max(axis=0).toarray().ravel()
+        else:
+            self._main_max_wtf = np.zeros(self._main_bm25.shape[1])
+        self._delta = None
+        self._delta_bm25 = None
+        self._refresh_weights()
+
+    def _delta_matrix(self) -> sp.csc_matrix:
+        if self._delta is None:
+            self._delta = _rows_to_csc(self._cols[self._n_main:], self._tfs[self._n_main:], len(self._df))
+        return self._delta
+
+    def _delta_bm25_matrix(self) -> sp.csc_matrix:
+        if self._delta_bm25 is None:
+            self._delta_bm25 = _rows_to_csc(self._cols[self._n_main:], self._wtfs[self._n_main:], len(self._df))
+        return self._delta_bm25
+
+    def _bm25_postings(self, col: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Row ids (ascending) and weighted tfs for one term across main and delta
+        rows, wtfs = [], []
+        if col < self._main_bm25.shape[1]:
+            lo, hi = self._main_bm25.indptr[col], self._main_bm25.indptr[col + 1]
+            rows.append(self._main_bm25.indices[lo:hi])
+            wtfs.append(self._main_bm25.data[lo:hi])
+        if self._n_rows > self._n_main:
+            delta = self._delta_bm25_matrix()
+            lo, hi = delta.indptr[col], delta.indptr[col + 1]
+            rows.append(delta.indices[lo:hi] + self._n_main)
+            wtfs.append(delta.data[lo:hi])
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(rows), np.concatenate(wtfs)
+
+    # -------- queries --------
+
+    def query_weights(self, query: str, fuzzy: bool = True) -> Dict[str, float]:
+        # Term -> query weight. A term no live note contains stands in for its closest
+        # indexed spellings, each weighted by its trigram similarity. The searches accept
+        # these weights in place of the query, so callers can reuse them for highlight().
+        weights: Dict[str, float] = {}
+        with self._lock:
+            for term in self.analyze(query):
+                col = self._vocab.get(term)
+                if col is not None and self._df[col] > 0:
+                    weights[term] = weights.get(term, 0.0) + 1.0
+                elif fuzzy:
+                    for match, sim in self._trigrams.similar(term):
+                        weights[match] = weights.get(match, 0.0) + sim
+        return weights
+
+    def search(self, query: str | Dict[str, float], limit: int = 20, fuzzy: bool = True) -> List[Tuple[str, float]]:
+        if limit <= 0:
+            return []
+        with self._lock:
+            counts = query if isinstance(query, dict) else self.query_weights(query, fuzzy)
+            if not counts or not self._n_live:
+                return []
+            self._maybe_refresh()
+            cols = np.fromiter((self._vocab[t] for t in counts), dtype=np.int32, count=len(counts))
+            qw = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) * self._idf[cols]
+            qnorm = np.linalg.norm(qw)
+            weights = qw * self._idf[cols]
+
+            scores = np.zeros(self._n_rows)
+            if self._n_main:
+                in_main = cols < self._main.shape[1]
+                scores[: self._n_main] = self._main[:, cols[in_main]] @ weights[in_main]
+            if self._n_rows > self._n_main:
+                scores[self._n_main :] = self._delta_matrix()[:, cols] @ weights
+            scores[~self._alive[: self._n_rows]] = 0
+            norms = self._norms[: self._n_rows]
+            np.divide(scores, norms * qnorm, out=scores, where=norms > 0)
+
+            hits = np.flatnonzero(scores > 0)
+            if hits.size > limit:
+                hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            return [(self._ids[r], float(scores[r])) for r in hits]
+
+    def search_bm25(self, query: str | Dict[str, float], limit: int = 20, fuzzy: bool = True) -> List[Tuple[str, float]]:
+        if limit <= 0:
+            return []
+        with self._lock:
+            counts = query if isinstance(query, dict) else self.query_weights(query, fuzzy)
+            n = self._n_live
+            if not counts or not n:
+                return []
+            k1, b = self.k1, self.b
+            avg_length = self._total_length / n or 1.0
+            lengths = self._lengths[: self._n_rows]
+            alive = self._alive[: self._n_rows]
+
+            # Upper bound per term: its largest weighted tf against the shortest document
+            plan = []
+            for term, qtf in counts.items():
+                col = self._vocab[term]
+                df = self._df[col]
+                if df <= 0:
+                    continue
+                idf = qtf * np.log(1 + (n - df + 0.5) / (df + 0.5))
+                rows, wtfs = self._bm25_postings(col)
+                if not rows.size:
+                    continue
+                max_wtf = self._main_max_wtf[col] if col < len(self._main_max_wtf) else 0.0
+                if rows[-1] >= self._n_main:
+                    max_wtf = max(max_wtf, wtfs[rows >= self._n_main].max())
+                bound = idf * max_wtf * (k1 + 1) / (max_wtf + k1 * (1 - b + b * self._min_length / avg_length))
+                plan.append((bound, idf, rows, wtfs))
+            plan.sort(key=lambda p: p[0], reverse=True)
+            remaining = np.concatenate([np.cumsum([p[0] for p in plan][::-1])[::-1], [0.0]])
+
+            # MaxScore, term at a time: once the bounds of the terms left cannot lift an
+            # unseen row past the current k-th score, only existing candidates are scored.
+            scores = np.zeros(self._n_rows)
+            candidates = np.zeros(0, dtype=np.int64)
+            threshold = 0.0
+            for i, (_, idf, rows, wtfs) in enumerate(plan):
+                if i and candidates.size >= limit and remaining[i] <= threshold:
+                    candidates = candidates[scores[candidates] + remaining[i] > threshold]
+                    pos = np.searchsorted(rows, candidates)
+                    pos[pos >= rows.size] = 0
+                    hit = rows[pos] == candidates
+                    rows, wtfs = rows[pos[hit]], wtfs[pos[hit]]
+                else:
+                    keep = alive[rows]
+                    rows, wtfs = rows[keep], wtfs[keep]
+                    candidates = np.union1d(candidates, rows)
+                scores[rows] += idf * wtfs * (k1 + 1) / (wtfs + k1 * (1 - b + b * lengths[rows] / avg_length))
+                if candidates.size >= limit:
+                    threshold = np.partition(scores[candidates], candidates.size - limit)[candidates.size - limit]
+
+            hits = candidates[scores[candidates] > 0]
+            if hits.size > limit:
+                hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            return [(self._ids[r], float(scores[r])) for r in hits]
+
+    def highlight(self, doc_id: str, weights: Dict[str, float], title: str | None, content: str | None) -> Dict[str, Any]:
+        """Best-window snippet of a note with the offsets of its matches for weights."""
+        title, content = title or "", content or ""
+        with self._lock:
+            row = self._row_of.get(doc_id)
+            if row is not None and self._crcs[row] == zlib.crc32(content.encode()):
+                cols = self._pos_cols[row]
+                wanted = np.fromiter((self._vocab[t] for t in weights if t in self._vocab), dtype=np.int32)
+                hit = np.isin(cols, wanted)
+                matches = [(int(start), self._terms[col]) for col, start in zip(cols[hit], self._pos_starts[row][hit])]
+            else:
+                # Not indexed as this text (written since, or a semantic hit before the
+                # engine loaded): tokenize just this note
+                matches = [(start, term) for term, start in self._tokens(content) if term in weights]
+        snippet, highlights = make_snippet(content, matches, weights, TOKEN_RE)
+        return {"snippet": snippet, "highlights": highlights, "title_highlights": highlight_spans(title, weights, TOKEN_RE)}
+
+
+def _rows_to_csc(cols: List[np.ndarray], tfs: List[np.ndarray], n_terms: int) -> sp.csc_matrix:
+    indptr = np.zeros(len(cols) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in cols], out=indptr[1:])
+    indices = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int32)
+    data = np.concatenate(tfs) if tfs else np.zeros(0)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(cols), n_terms)).tocsc()
+
+
+note_engine = TfidfSearchEngine()
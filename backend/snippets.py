@@ -0,0 +1,73 @@
+import re
+from typing import Dict, Iterator, List, Tuple
+
+# Search-result snippets cut from stored term positions: the window of SNIPPET_LEN chars
+# covering the most (and most heavily weighted) query terms, with the character offsets of
+# every match inside it so clients can highlight them.
+
+SNIPPET_LEN = 200
+ELLIPSIS = "…"
+
+
+def token_starts(text: str, pattern: re.Pattern) -> Iterator[Tuple[str, int]]:
+    """(lowercased token, start offset in text) for every token, in order."""
+    lowered = text.lower()
+    # Offsets must index the original text; lower() changes the length of a few characters
+    source = lowered if len(lowered) == len(text) else text
+    for m in pattern.finditer(source):
+        yield m.group().lower(), m.start()
+
+
+def highlight_spans(text: str, weights: Dict[str, float], pattern: re.Pattern) -> List[List[int]]:
+    # For short fields (titles) that are not worth storing positions for
+    return [[start, _token_end(text, start, term, pattern)] for term, start in token_starts(text, pattern) if term in weights]
+
+
+def make_snippet(text: str, matches: List[Tuple[int, str]], weights: Dict[str, float], pattern: re.Pattern, length: int = SNIPPET_LEN) -> Tuple[str, List[List[int]]]:
+    """Best window of text for (start, term) matches sorted by start; returns
+    (snippet, [[start, end], ...] offsets of the matches within the snippet)."""
+    text = text or ""
+    if not matches:
+        return text[:length] + (ELLIPSIS if len(text) > length else ""), []
+    spans = [(start, _token_end(text, start, term, pattern), term) for start, term in matches]
+
+    # Sliding window over the matches: distinct terms count by weight, repeats only break ties
+    best, best_score = (0, 0), -1.0
+    counts: Dict[str, int] = {}
+    covered = 0.0
+    lo = 0
+    for hi, (_, end, term) in enumerate(spans):
+        counts[term] = counts.get(term, 0) + 1
+        if counts[term] == 1:
+            covered += weights.get(term, 1.0)
+        while end - spans[lo][0] > length:
+            left = spans[lo][2]
+            counts[left] -= 1
+            if not counts[left]:
+                covered -= weights.get(left, 1.0)
+            lo += 1
+        score = covered + 0.001 * (hi - lo + 1)
+        if score > best_score:
+            best, best_score = (lo, hi), score
+
+    first, last = spans[best[0]][0], spans[best[1]][1]
+    # Center the matches in the window, then trim to word boundaries
+    start = max(0, min(first - max(0, length - (last - first)) // 2, len(text) - length))
+    end = min(len(text), start + length)
+    if start > 0:
+        space = text.find(" ", start, first)
+        if space != -1:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(" ", last, end)
+        if space != -1:
+            end = space
+    prefix = ELLIPSIS if start > 0 else ""
+    snippet = prefix + text[start:end] + (ELLIPSIS if end < len(text) else "")
+    shift = len(prefix) - start
+    return snippet, [[s + shift, e + shift] for s, e, _ in spans if s >= start and e <= end]
+
+
+def _token_end(text: str, start: int, term: str, pattern: re.Pattern) -> int:
+    m = pattern.match(text, start)
+    return m.end() if m else start + len(term)
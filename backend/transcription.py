@@ -0,0 +1,218 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from typing import Any, AsyncIterable, BinaryIO, Dict, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+# /transcribe uploads: the body is consumed chunk by chunk into a spooled temp file, with
+# the size cap checked as bytes arrive, then handed to a pluggable Transcriber.
+
+TRANSCRIBE_MAX_BYTES = int(os.getenv("TRANSCRIBE_MAX_BYTES", 50 * 1024 * 1024))
+TRANSCRIBER = os.getenv("TRANSCRIBER", "stub")
+# Uploads up to this size stay in memory; larger ones roll over to disk
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Room for multipart boundaries and part headers when pre-checking Content-Length
+MULTIPART_SLACK = 64 * 1024
+UPLOAD_FIELD = "file"
+# Where uploads queued as background jobs wait for a worker
+JOB_AUDIO_DIR = os.getenv("JOB_AUDIO_DIR") or tempfile.gettempdir()
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class _Spool:
+    def __init__(self, max_bytes: int):
+        self.file = SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self.file.write(data)
+
+
+class _FilePart:
+    # MultipartParser callbacks that copy the UPLOAD_FIELD part into the spool and skip the rest
+    def __init__(self, spool: _Spool):
+        self.spool = spool
+        self.found = False
+        self.active = False
+        self._field = b""
+        self._value = b""
+        self._name = None
+
+    def callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._name = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def on_header_end(self):
+        if self._field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._value)
+            self._name = options.get(b"name", b"").decode("latin-1")
+        self._field, self._value = b"", b""
+
+    def on_headers_finished(self):
+        self.active = not self.found and self._name == UPLOAD_FIELD
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.active:
+            self.spool.write(data[start:end])
+
+    def on_part_end(self):
+        if self.active:
+            self.found = True
+            self.active = False
+
+
+async def receive_audio(content_type: str, content_length: str | None, body: AsyncIterable[bytes], max_bytes: int = TRANSCRIBE_MAX_BYTES) -> BinaryIO:
+    """Spool a raw audio body, or the "file" part of a multipart form, to a temp file.
+    Raises UploadTooLarge as soon as more than max_bytes have arrived; returns the file rewound."""
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_SLACK:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+    spool = _Spool(max_bytes)
+    try:
+        ctype, params = parse_options_header(content_type or "")
+        if ctype == b"multipart/form-data":
+            boundary = params.get(b"boundary")
+            if not boundary:
+                raise ValueError("Missing multipart boundary")
+            part = _FilePart(spool)
+            parser = MultipartParser(boundary, part.callbacks())
+            async for chunk in body:
+                parser.write(chunk)
+            parser.finalize()
+            if not part.found:
+                raise ValueError(f"Missing '{UPLOAD_FIELD}' upload")
+        else:
+            async for chunk in body:
+                spool.write(chunk)
+        if not spool.size:
+            raise ValueError("Empty upload")
+        spool.file.seek(0)
+        return spool.file
+    except BaseException:
+        spool.file.close()
+        raise
+
+
+def stash_audio(audio: BinaryIO) -> Tuple[str, str]:
+    """Copy a spooled upload to a named file for a background job; returns (path, sha256)."""
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=JOB_AUDIO_DIR, prefix="transcribe-", suffix=".audio", delete=False) as out:
+        try:
+            for chunk in iter(lambda: audio.read(COPY_CHUNK_BYTES), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        except BaseException:
+            os.remove(out.name)
+            raise
+    return out.name, digest.hexdigest()
+
+
+def remove_stashed(params: Dict[str, Any]):
+    try:
+        os.remove(params["path"])
+    except FileNotFoundError:
+        pass
+
+
+def wav_duration(f, size: int) -> float | None:
+    """Seconds of audio from the RIFF/WAVE fmt and data headers; None for other containers."""
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    byte_rate = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size)
+            if len(fmt) < 12:
+                return None
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+            if f.tell() + (chunk_size & 1) > size:
+                return None
+            f.seek(chunk_size & 1, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # Streamed recordings may leave the size unset; count what was actually received
+            available = size - f.tell()
+            if chunk_size in (0, 0xFFFFFFFF) or chunk_size > available:
+                chunk_size = available
+            return chunk_size / byte_rate
+        else:
+            # A truncated or corrupt size would seek past the end (mmap raises on that)
+            skip = chunk_size + (chunk_size & 1)
+            if f.tell() + skip > size:
+                return None
+            f.seek(skip, os.SEEK_CUR)
+
+
+@contextmanager
+def mapped(audio: BinaryIO):
+    # Read-only mmap of the spooled file (this rolls an in-memory spool over to disk)
+    view = mmap.mmap(audio.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield view
+    finally:
+        view.close()
+
+
+class Transcriber(ABC):
+    """Turns an uploaded audio file into {"text", "language", "duration"}."""
+
+    @abstractmethod
+    def transcribe(self, audio: BinaryIO) -> Dict[str, Any]:
+        ...
+
+
+class LocalStubTranscriber(Transcriber):
+    # Demo stand-in for Whisper or an external ASR service; only reads the headers
+    def transcribe(self, audio: BinaryIO) -> Dict[str, Any]:
+        with mapped(audio) as view:
+            duration = wav_duration(view, len(view))
+        if duration is None:
+            text = "Transcribed audio of unknown length (demo)"
+        else:
+            text = f"Transcribed {max(1, round(duration))}s of audio (demo)"
+        return {"text": text, "language": "en", "duration": duration}
+
+
+TRANSCRIBERS = {"stub": LocalStubTranscriber}
+
+
+def get_transcriber(name: str = TRANSCRIBER) -> Transcriber:
+    if name not in TRANSCRIBERS:
+        raise ValueError(f"Unknown transcriber: {name}")
+    return TRANSCRIBERS[name]()
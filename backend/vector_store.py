@@ -0,0 +1,480 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from live_index import LiveIndex, grow, now_ms, stamp
+
+logger = logging.getLogger(__name__)
+
+# Vector store behind semantic /ai/search.
+#
+# Notes are embedded locally (CPU only) and kept as float32 rows in memory-mapped files:
+# vectors, the note id of each row and the updated_at each row was embedded from. Like the
+# TF-IDF engine, rows are append-only: an edit marks the old row dead and appends a new one,
+# and dead rows are compacted away once they pile up.
+#
+# Compaction, IVF (re)training and regrouping, and saving the row count to meta.json run on
+# the maintenance thread (see LiveIndex). meta.json is saved once META_SAVE_ROWS appended
+# rows are unsaved or a write finds the last save META_SAVE_SECONDS old, and on close; rows
+# appended past the saved count before a crash are simply re-embedded by the next load scan.
+#
+# Small stores are searched exactly, one matrix-vector product per block of rows. Past
+# IVF_MIN_ROWS an IVF index takes over: rows are grouped under their nearest k-means
+# centroid and a query only scores the IVF_NPROBE closest groups, plus the rows appended
+# since the last regroup.
+#
+# The store lives in VECTOR_STORE_DIR (by default a directory under the system temp dir) and
+# survives restarts: the load scan only re-embeds notes written since. One process owns the
+# directory at a time (an flock on its lock file); another worker that finds it taken falls
+# back to a private temp dir, rebuilt on each start.
+
+EMBEDDER = os.getenv("EMBEDDER", "hashing")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 128))
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR") or os.path.join(tempfile.gettempdir(), "notes-vectors")
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", 20000))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 8))
+# Rows per block of an exact scan, and texts per embedding batch
+SCAN_BATCH_ROWS = 65536
+EMBED_BATCH = 1024
+ID_BYTES = 24
+MIN_CAPACITY = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 32
+META_SAVE_ROWS = 1024
+META_SAVE_SECONDS = 30
+
+def note_text(title: str | None, content: str | None) -> str:
+    return f"{title or ''}\n{content or ''}"
+
+
+class Embedder(ABC):
+    """Maps texts to L2-normalized float32 rows of width dim."""
+
+    name = ""
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder(Embedder):
+    # Word uni/bigrams and character 3/4-grams are hashed into n_features buckets, then
+    # projected down to dim by a fixed sparse random matrix (nnz signed entries per bucket).
+    # Character grams let inflections and typos land near each other.
+    def __init__(self, dim: int = EMBEDDING_DIM, n_features: int = 2 ** 18, nnz: int = 4, char_weight: float = 0.5, seed: int = 0):
+        self.dim = dim
+        self.name = f"hashing-{dim}-{n_features}-{nnz}-{char_weight}-{seed}"
+        self.char_weight = char_weight
+        self._words = HashingVectorizer(n_features=n_features, stop_words="english", ngram_range=(1, 2), alternate_sign=False, dtype=np.float32)
+        self._chars = HashingVectorizer(n_features=n_features, analyzer="char_wb", ngram_range=(3, 4), alternate_sign=False, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        rows = np.repeat(np.arange(n_features), nnz)
+        cols = rng.integers(0, dim, size=n_features * nnz)
+        signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=n_features * nnz) / np.float32(np.sqrt(nnz))
+        self._projection = sp.csr_matrix((signs, (rows, cols)), shape=(n_features, dim), dtype=np.float32)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        features = self._words.transform(texts) + self.char_weight * self._chars.transform(texts)
+        out = (features @ self._projection).toarray().astype(np.float32, copy=False)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+EMBEDDERS = {"hashing": HashingEmbedder}
+
+
+def get_embedder(name: str = EMBEDDER) -> Embedder:
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder: {name}")
+    return EMBEDDERS[name]()
+
+
+class VectorStore(LiveIndex):
+    def __init__(
+        self,
+        embedder: Embedder,
+        path: str | None = VECTOR_STORE_DIR,
+        ivf_min_rows: int = IVF_MIN_ROWS,
+        nprobe: int = IVF_NPROBE,
+        merge_ratio: float = 0.1,
+        min_merge: int = 1024,
+    ):
+        super().__init__()
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._merge_ratio = merge_ratio
+        self._min_merge = min_merge
+        self._tmp: tempfile.TemporaryDirectory | None = None
+        self._lock_file = None
+        self.path = path
+
+        # Row storage, opened lazily by begin_load. Dead rows have an empty id.
+        self._rows = 0
+        self._capacity = 0
+        self._vectors: np.memmap | None = None
+        self._ids: np.memmap | None = None
+        self._stamps: np.memmap | None = None
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        # Rows the load scan found current; the rest belong to notes deleted meanwhile
+        self._seen: np.ndarray | None = None
+
+        # IVF over rows [0, _n_indexed): _order lists them grouped by centroid, group g
+        # being _order[_offsets[g]:_offsets[g + 1]]. Later rows are scanned exactly.
+        self._centroids: np.ndarray | None = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._order = np.zeros(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._n_indexed = 0
+        self._trained_rows = 0
+        # Row count last written to meta.json, and when
+        self._saved_rows = 0
+        self._saved_at = 0.0
+
+    def __len__(self):
+        return len(self._row_of)
+
+    # -------- files --------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        if self._vectors is not None:
+            return
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._lock_file = open(self._file("lock"), "w")
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.warning("Vector store %s is in use by another process; using a temp dir", self.path)
+                self._lock_file.close()
+                self._lock_file = None
+                self.path = None
+        if not self.path:
+            self._tmp = tempfile.TemporaryDirectory(prefix="vectors-")
+            self.path = self._tmp.name
+        meta = None
+        try:
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+        if meta and meta.get("embedder") == self.embedder.name and meta.get("dim") == self.dim:
+            capacity = os.path.getsize(self._file("vectors.f32")) // (4 * self.dim)
+            self._map(capacity)
+            self._rows = min(meta["rows"], capacity)
+        else:
+            # New store, or vectors from a different embedder: start over
+            self._map(MIN_CAPACITY, truncate=True)
+            self._rows = 0
+            self._save_meta()
+        ids = self._ids[: self._rows]
+        self._alive = grow(ids != b"", self._capacity)
+        self._row_of = {}
+        for row in np.flatnonzero(self._alive[: self._rows]):
+            doc_id = ids[row].decode()
+            # A crash between appending a row and killing the one it replaced
+            if doc_id in self._row_of:
+                self._kill(self._row_of[doc_id])
+            self._row_of[doc_id] = int(row)
+
+    def _map(self, capacity: int, truncate: bool = False):
+        for name, width in (("vectors.f32", 4 * self.dim), ("ids.s24", ID_BYTES), ("stamps.i64", 8)):
+            with open(self._file(name), "w+b" if truncate else "r+b") as f:
+                f.truncate(capacity * width)
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(self._file("ids.s24"), dtype=f"S{ID_BYTES}", mode="r+", shape=(capacity,))
+        self._stamps = np.memmap(self._file("stamps.i64"), dtype=np.int64, mode="r+", shape=(capacity,))
+        self._capacity = capacity
+
+    def _reserve(self, n: int):
+        if self._rows + n <= self._capacity:
+            return
+        self.flush()
+        capacity = max(self._rows + n, 2 * self._capacity, MIN_CAPACITY)
+        self._vectors = self._ids = self._stamps = None
+        self._map(capacity)
+        self._alive = grow(self._alive, capacity)
+
+    def _save_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"embedder": self.embedder.name, "dim": self.dim, "rows": self._rows}, f)
+        os.replace(tmp, self._file("meta.json"))
+        self._saved_rows = self._rows
+        self._saved_at = time.monotonic()
+
+    def _meta_due(self) -> bool:
+        unsaved = self._rows - self._saved_rows
+        return unsaved >= META_SAVE_ROWS or (unsaved > 0 and time.monotonic() - self._saved_at >= META_SAVE_SECONDS)
+
+    def flush(self):
+        with self._lock:
+            for arr in (self._vectors, self._ids, self._stamps):
+                if arr is not None:
+                    arr.flush()
+
+    def close(self):
+        self.stop_maintenance()
+        with self._lock:
+            if self._vectors is not None:
+                self.flush()
+                self._save_meta()
+            self._vectors = self._ids = self._stamps = None
+            if self._tmp is not None:
+                self._tmp.cleanup()
+                self._tmp = None
+                self.path = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            self.loaded = False
+
+    # -------- loading / writes --------
+
+    def _begin_load(self):
+        self._open()
+        self._seen = np.zeros(self._capacity, dtype=bool)
+
+    def _load(self, docs: Iterable[Dict[str, Any]]):
+        # Only notes new or changed since their row was embedded are embedded again
+        stale = []
+        for d in docs:
+            doc_id, ts = str(d["_id"]), stamp(d.get("updated_at"))
+            if self._is_current(doc_id, ts):
+                self._seen[self._row_of[doc_id]] = True
+            else:
+                stale.append((doc_id, ts, note_text(d.get("title"), d.get("content"))))
+        self._append([(doc_id, ts) for doc_id, ts, _ in stale], self._embed([text for _, _, text in stale]))
+        self._seen = grow(self._seen, self._capacity)
+        for doc_id, _, _ in stale:
+            self._seen[self._row_of[doc_id]] = True
+
+    def _after_load(self):
+        gone = np.flatnonzero(self._alive[: self._rows] & ~self._seen[: self._rows])
+        for doc_id in [self._ids[row].decode() for row in gone]:
+            self._remove(doc_id)
+        self._seen = None
+        self._maybe_reindex()
+        self._save_meta()
+
+    def _add(self, doc_id: str, title: str, content: str):
+        self._add_batch(self._prepare([(doc_id, title, content)]))
+
+    def _prepare(self, docs: List[Tuple[str, str, str]]) -> Tuple[List[Tuple[str, int]], np.ndarray]:
+        # Stamped after the write it follows, so a restart sees the row as current
+        ts = now_ms()
+        return [(doc_id, ts) for doc_id, _, _ in docs], self._embed([note_text(title, content) for _, title, content in docs])
+
+    def _add_batch(self, batch: Tuple[List[Tuple[str, int]], np.ndarray]):
+        self._append(*batch)
+
+    # Note versions are the rows' stamps
+    def _mark_written(self, doc_ids: List[str]):
+        pass
+
+    def _is_current(self, doc_id: str, ts: int) -> bool:
+        row = self._row_of.get(doc_id)
+        return row is not None and ts <= self._stamps[row]
+
+    def _indexed(self) -> Iterable[Tuple[str, int]]:
+        return ((doc_id, int(self._stamps[row])) for doc_id, row in self._row_of.items())
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate([self.embedder.embed(texts[i : i + EMBED_BATCH]) for i in range(0, len(texts), EMBED_BATCH)])
+
+    def _append(self, keys: List[Tuple[str, int]], vectors: np.ndarray):
+        # One row per (doc_id, stamp); a later row for an id replaces the earlier one
+        self._reserve(len(keys))
+        for i, (doc_id, ts) in enumerate(keys):
+            self._remove(doc_id)
+            row = self._rows + i
+            self._ids[row] = doc_id.encode()
+            self._stamps[row] = ts
+            self._alive[row] = True
+            self._row_of[doc_id] = row
+        self._vectors[self._rows : self._rows + len(keys)] = vectors
+        self._rows += len(keys)
+
+    def _remove(self, doc_id: str):
+        row = self._row_of.pop(doc_id, None)
+        if row is not None:
+            self._kill(row)
+
+    def _kill(self, row: int):
+        self._alive[row] = False
+        self._ids[row] = b""
+
+    # -------- IVF index --------
+
+    def _maintenance_due(self) -> bool:
+        live = len(self._row_of)
+        dropped = live < self.ivf_min_rows and self._centroids is not None
+        return self._compact_due() or dropped or self._train_due() or self._regroup_due() or self._meta_due()
+
+    def _maintain(self):
+        # k-means runs on a copied sample without the lock; writes and searches only wait
+        # for the compaction and regrouping around it
+        with self._lock:
+            sample = self._train_sample() if self._train_due() else None
+        trained = None if sample is None else self._fit(*sample)
+        with self._lock:
+            self._maybe_reindex(trained)
+            self._save_meta()
+
+    def _compact_due(self) -> bool:
+        live = len(self._row_of)
+        return self._rows - live > max(self._min_merge, live // 4)
+
+    def _train_due(self) -> bool:
+        live = len(self._row_of)
+        return live >= self.ivf_min_rows and (self._centroids is None or live > 4 * self._trained_rows)
+
+    def _regroup_due(self) -> bool:
+        return self._centroids is not None and self._rows - self._n_indexed > max(self._min_merge, self._merge_ratio * self._n_indexed)
+
+    def _maybe_reindex(self, trained: Tuple[np.ndarray, int] | None = None):
+        if self._compact_due():
+            self._compact()
+        if len(self._row_of) < self.ivf_min_rows:
+            self._centroids = None
+            self._n_indexed = 0
+        elif self._train_due():
+            self._centroids, self._trained_rows = trained or self._fit(*self._train_sample())
+            self._regroup(0)
+        elif self._regroup_due():
+            self._regroup(self._n_indexed)
+
+    def _train_sample(self) -> Tuple[np.ndarray, int, int]:
+        # A copy of live rows to fit about sqrt(n) centroids to, the centroid count, and n
+        live = np.flatnonzero(self._alive[: self._rows])
+        n_lists = max(1, int(np.sqrt(live.size)))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, size=min(live.size, KMEANS_SAMPLE_PER_LIST * n_lists), replace=False))
+        return np.array(self._vectors[sample]), n_lists, live.size
+
+    def _fit(self, x: np.ndarray, n_lists: int, n: int) -> Tuple[np.ndarray, int]:
+        # Spherical k-means; returns the centroids and the live row count they were fit at
+        rng = np.random.default_rng(0)
+        centroids = x[rng.choice(x.shape[0], size=n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = np.argmax(x @ centroids.T, axis=1)
+            members = sp.csr_matrix((np.ones(x.shape[0], dtype=np.float32), (assign, np.arange(x.shape[0]))), shape=(n_lists, x.shape[0]))
+            sums = np.asarray(members @ x)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            sums[empty] = x[rng.choice(x.shape[0], size=int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = (sums / norms[:, None]).astype(np.float32)
+        return centroids, n
+
+    def _regroup(self, start: int):
+        # Assign rows [start, _rows) to their nearest centroid, then regroup everything
+        self._assign = grow(self._assign, self._rows)
+        for lo in range(start, self._rows, SCAN_BATCH_ROWS):
+            hi = min(lo + SCAN_BATCH_ROWS, self._rows)
+            self._assign[lo:hi] = np.argmax(self._vectors[lo:hi] @ self._centroids.T, axis=1)
+        self._n_indexed = self._rows
+        self._group()
+
+    def _group(self):
+        live = np.flatnonzero(self._alive[: self._n_indexed])
+        self._order = live[np.argsort(self._assign[live], kind="stable")]
+        self._offsets = np.searchsorted(self._assign[self._order], np.arange(len(self._centroids) + 1))
+
+    def _compact(self):
+        # Rewrite the live rows into fresh files; row order (and so IVF grouping) is kept
+        keep = np.flatnonzero(self._alive[: self._rows])
+        names = ("vectors.f32", "ids.s24", "stamps.i64")
+        old = (self._vectors, self._ids, self._stamps)
+        capacity = max(2 * keep.size, MIN_CAPACITY)
+        new = [
+            np.memmap(self._file(name + ".new"), dtype=arr.dtype, mode="w+", shape=(capacity,) + arr.shape[1:])
+            for name, arr in zip(names, old)
+        ]
+        for lo in range(0, keep.size, SCAN_BATCH_ROWS):
+            rows = keep[lo : lo + SCAN_BATCH_ROWS]
+            for src, dst in zip(old, new):
+                dst[lo : lo + rows.size] = src[rows]
+        for arr in new:
+            arr.flush()
+        self._vectors = self._ids = self._stamps = None
+        del old, new
+        for name in names:
+            os.replace(self._file(name + ".new"), self._file(name))
+        self._map(capacity)
+        self._rows = keep.size
+        self._alive = grow(np.ones(keep.size, dtype=bool), capacity)
+        self._row_of = {self._ids[row].decode(): row for row in range(keep.size)}
+        if self._centroids is not None:
+            n_indexed = int(np.searchsorted(keep, self._n_indexed))
+            self._assign = self._assign[keep[:n_indexed]]
+            self._n_indexed = n_indexed
+            self._group()
+        self._save_meta()
+
+    # -------- queries --------
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        if limit <= 0 or not query.strip():
+            return []
+        q = self.embedder.embed([query])[0]
+        if not q.any():
+            return []
+        with self._lock:
+            if not self._row_of:
+                return []
+            parts_rows, parts_scores = [], []
+            if self._centroids is not None and self._n_indexed:
+                closeness = self._centroids @ q
+                nprobe = min(self.nprobe, closeness.size)
+                probe = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+                rows = np.sort(np.concatenate([self._order[self._offsets[g] : self._offsets[g + 1]] for g in probe]))
+                parts_rows.append(rows)
+                parts_scores.append(self._vectors[rows] @ q)
+            # Rows not grouped yet: exact, one block at a time
+            for lo in range(self._n_indexed, self._rows, SCAN_BATCH_ROWS):
+                hi = min(lo + SCAN_BATCH_ROWS, self._rows)
+                parts_rows.append(np.arange(lo, hi))
+                parts_scores.append(self._vectors[lo:hi] @ q)
+            rows = np.concatenate(parts_rows)
+            scores = np.concatenate(parts_scores)
+            hit = self._alive[rows] & (scores > 0)
+            rows, scores = rows[hit], scores[hit]
+            if rows.size > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                rows, scores = rows[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+            return [(self._ids[rows[i]].decode(), float(scores[i])) for i in order]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "embedder": self.embedder.name,
+                "live": len(self._row_of),
+                "rows": self._rows,
+                "capacity": self._capacity,
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "indexed": self._n_indexed,
+                "persistent": self._tmp is None and bool(self.path),
+            }
+
+
+note_vectors = VectorStore(get_embedder())
@@ -0,0 +1,77 @@
+"""
+Serialization benchmark for GET /notes
+
+Times turning 10k note documents (as Mongo returns them) into a response body:
+- before: response_model validation + jsonable_encoder + JSONResponse
+- after: FastJSONResponse (orjson) returned directly from the route
+
+Run: python bench_serialization.py [notes] [repeats]
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from json_response import FastJSONResponse
+from main import app, NOTE_FIELDS, _note_out
+
+
+def make_docs(n: int) -> List[dict]:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "_id": ObjectId(),
+            "title": f"Note {i}",
+            "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8,
+            "folder_id": str(ObjectId()) if i % 3 else None,
+            "tags": ["study", "exam"] if i % 2 else [],
+            "header_style": "soft",
+            "created_at": start + timedelta(minutes=i),
+            "updated_at": start + timedelta(minutes=i, seconds=30),
+        }
+        for i in range(n)
+    ]
+
+
+async def before(docs: List[dict], field) -> bytes:
+    content = [_note_out(d, NOTE_FIELDS) for d in docs]
+    encoded = await serialize_response(field=field, response_content=content)
+    return JSONResponse(encoded).body
+
+
+async def after(docs: List[dict], field) -> bytes:
+    return FastJSONResponse([_note_out(d, NOTE_FIELDS) for d in docs]).body
+
+
+async def timed(fn, docs: List[dict], field, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        await fn(docs, field)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+async def main(n: int, repeats: int):
+    docs = make_docs(n)
+    # The response_model field FastAPI validates GET /notes against
+    field = next(r.response_field for r in app.routes if getattr(r, "path", None) == "/notes" and "GET" in r.methods)
+    slow = await timed(before, docs, field, repeats)
+    fast = await timed(after, docs, field, repeats)
+    per_10k = 10_000 / n * 1000
+    print(f"{n} notes, best of {repeats}")
+    print(f"before (response_model + jsonable_encoder): {slow * per_10k:8.1f} ms per 10k notes")
+    print(f"after  (orjson, no re-validation):          {fast * per_10k:8.1f} ms per 10k notes")
+    print(f"speedup: {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(n, repeats))
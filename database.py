@@ -1,20 +1,157 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING, TEXT, monitoring
 from datetime import datetime, timezone
+import base64
+import json
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from typing import Union
 from pydantic import BaseModel
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 _client = None
 db = None
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
+# Connection pool settings (MongoClient option <- env var). Unset vars keep the driver default.
+# Compressors are tried in order; zstd/snappy need the zstandard/python-snappy packages.
+POOL_ENV = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "compressors": ("MONGO_COMPRESSORS", str),
+    "readPreference": ("MONGO_READ_PREFERENCE", str),
+}
+# Pool sizing is for the async client that serves requests; the sync client only runs
+# startup DDL (ensure_indexes) and scripts, so it keeps the driver's lazy defaults
+POOL_SIZING = ("maxPoolSize", "minPoolSize", "maxIdleTimeMS", "waitQueueTimeoutMS")
+WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS") or os.getenv("MONGO_MIN_POOL_SIZE") or 1)
+
+# Newest first, with _id as tie-breaker so keyset pages are stable
+LIST_SORT = [("updated_at", -1), ("_id", -1)]
+
+# Index registry: applied idempotently by ensure_indexes() at startup
+INDEXES = {
+    "note": [
+        IndexModel([("folder_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="note_folder_updated"),
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="note_updated"),
+        IndexModel([("tags", ASCENDING)], name="note_tags"),
+        IndexModel([("title", TEXT), ("content", TEXT)], name="note_text"),
+    ],
+    "folder": [
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="folder_updated"),
+    ],
+}
+
+# Representative queries whose plans should never fall back to a collection scan
+INDEX_PROBES = {
+    "note": [
+        {"filter": {}, "sort": LIST_SORT},
+        {"filter": {"folder_id": ""}, "sort": LIST_SORT},
+        {"filter": {"tags": ""}},
+    ],
+    "folder": [
+        {"filter": {}, "sort": LIST_SORT},
+    ],
+}
+
+index_report: dict = {}
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters for operators, fed by the driver's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.created = 0
+        self.closed = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for k, v in deltas.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._bump(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._bump(created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(closed=1)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._bump(checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        waited = (time.perf_counter() - getattr(self._local, "started", time.perf_counter())) * 1000
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_ms_total += waited
+            self.wait_ms_max = max(self.wait_ms_max, waited)
+
+    def connection_checked_in(self, event):
+        self._bump(in_use=-1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "in_use": self.in_use,
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+            }
+
+
+def client_options(stats: PoolStats | None = None, pooled: bool = True) -> dict:
+    opts = {}
+    for option, (var, cast) in POOL_ENV.items():
+        value = os.getenv(var)
+        if value and (pooled or option not in POOL_SIZING):
+            opts[option] = cast(value)
+    if stats is not None:
+        opts["event_listeners"] = [stats]
+    return opts
+
+
 if DATABASE_URL and DATABASE_NAME:
-    _client = MongoClient(DATABASE_URL)
+    _client = MongoClient(DATABASE_URL, **client_options(pooled=False))
     db = _client[DATABASE_NAME]
 
 
@@ -23,6 +160,37 @@ def _ensure_db():
         raise Exception("Database not available. Set DATABASE_URL and DATABASE_NAME.")
 
 
+def _plan_stages(plan) -> list:
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for v in plan.values():
+            stages += _plan_stages(v)
+        return stages
+    if isinstance(plan, list):
+        return [s for p in plan for s in _plan_stages(p)]
+    return []
+
+
+def ensure_indexes() -> dict:
+    """Create the registered indexes and report probe queries that still COLLSCAN."""
+    _ensure_db()
+    report = {"indexes": {}, "collscans": []}
+    for collection_name, models in INDEXES.items():
+        report["indexes"][collection_name] = db[collection_name].create_indexes(models)
+    for collection_name, probes in INDEX_PROBES.items():
+        for probe in probes:
+            cur = db[collection_name].find(probe["filter"])
+            if probe.get("sort"):
+                cur = cur.sort(probe["sort"])
+            plan = cur.explain().get("queryPlanner", {}).get("winningPlan", {})
+            if "COLLSCAN" in _plan_stages(plan):
+                report["collscans"].append({"collection": collection_name, **probe})
+                logger.warning("Query on %s still uses COLLSCAN: %s", collection_name, probe)
+    index_report.clear()
+    index_report.update(report)
+    return report
+
+
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
     _ensure_db()
     if isinstance(data, BaseModel):
@@ -35,14 +203,56 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     return str(res.inserted_id)
 
 
-def get_documents(collection_name: str, filter_dict: dict | None = None, limit: int | None = None):
+def get_documents(collection_name: str, filter_dict: dict | None = None, limit: int | None = None, projection: dict | None = None):
     _ensure_db()
-    cur = db[collection_name].find(filter_dict or {}).sort("updated_at", -1)
+    cur = db[collection_name].find(filter_dict or {}, projection).sort(LIST_SORT)
     if limit:
         cur = cur.limit(limit)
     return list(cur)
 
 
+# Keyset pagination over (updated_at, _id). Cursors are opaque to clients.
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps({"u": doc["updated_at"].isoformat(), "i": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    from bson import ObjectId
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(raw["u"]), ObjectId(raw["i"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(filter_dict: dict | None, cursor: str | None) -> dict:
+    if not cursor:
+        return filter_dict or {}
+    updated_at, _id = decode_cursor(cursor)
+    after = {"$or": [
+        {"updated_at": {"$lt": updated_at}},
+        {"updated_at": updated_at, "_id": {"$lt": _id}},
+    ]}
+    return {"$and": [filter_dict, after]} if filter_dict else after
+
+
+def get_documents_page(collection_name: str, filter_dict: dict | None = None, limit: int = 50,
+                       cursor: str | None = None, projection: dict | None = None):
+    """Return (docs, next_cursor); next_cursor is None on the last page."""
+    _ensure_db()
+    if projection:
+        projection = {**projection, "updated_at": 1}
+    cur = db[collection_name].find(keyset_filter(filter_dict, cursor), projection).sort(LIST_SORT).limit(limit + 1)
+    docs = list(cur)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1])
+
+
 def get_document(collection_name: str, _id):
     _ensure_db()
     from bson import ObjectId
@@ -0,0 +1,349 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timezone
+from typing import Union
+from pydantic import BaseModel
+
+from database import (
+    DATABASE_URL, DATABASE_NAME, LIST_SORT, WARMUP_CONNECTIONS,
+    PoolStats, client_options, keyset_filter, encode_cursor,
+)
+from cache import read_cache, query_key, MISSING, CACHE_MAX_LIST_LEN
+
+# asyncio counterpart of database.py for the FastAPI routes; same API, awaitable.
+# Concurrency is bounded by the driver's connection pool instead of the threadpool.
+
+_client = None
+db = None
+pool_stats = PoolStats()
+
+if DATABASE_URL and DATABASE_NAME:
+    _client = AsyncIOMotorClient(DATABASE_URL, **client_options(pool_stats))
+    db = _client[DATABASE_NAME]
+
+
+def _ensure_db():
+    if db is None:
+        raise Exception("Database not available. Set DATABASE_URL and DATABASE_NAME.")
+
+
+def _clone(value):
+    # Callers may mutate what they get back; keep the cached copy private
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(d) for d in value]
+    if isinstance(value, tuple):
+        return (_clone(value[0]),) + value[1:]
+    return value
+
+
+async def _read_through(key: tuple, fetch, cacheable=lambda value: True):
+    cached = read_cache.get(key)
+    if cached is not MISSING:
+        return _clone(cached)
+    generation = read_cache.generation(key[1])
+    value = await fetch()
+    if cacheable(value):
+        read_cache.put(key, _clone(value), generation)
+    return value
+
+
+# Per-collection counters bumped by writes that keep updated_at, so versions still move
+WRITE_COUNTERS = "write_counter"
+
+
+async def _count_write(collection_name: str):
+    await db[WRITE_COUNTERS].update_one({"_id": collection_name}, {"$inc": {"writes": 1}}, upsert=True)
+
+
+async def collection_version(collection_name: str) -> str:
+    """Version of the collection's contents, for ETags: document count, the newest
+    updated_at / _id (one seek on the listing index) and the collection's write counter,
+    which covers the writes that leave updated_at alone (derived fields, counters).
+
+    Taken from the database rather than the read cache's invalidation counters, which only
+    see writes made by this process: tags agree across workers and change on outside writes.
+    The value itself is read-through cached like the listings it validates, so writes from
+    this process show at once and others within CACHE_TTL_SECONDS.
+    """
+    _ensure_db()
+
+    async def fetch():
+        coll = db[collection_name]
+        newest, count, counter = await asyncio.gather(
+            coll.find({}, {"updated_at": 1}).sort(LIST_SORT).limit(1).to_list(length=1),
+            coll.estimated_document_count(),
+            db[WRITE_COUNTERS].find_one({"_id": collection_name}),
+        )
+        writes = counter["writes"] if counter else 0
+        if not newest:
+            return f"{count}-{writes}"
+        ts = newest[0].get("updated_at")
+        stamp = ts.strftime("%Y%m%d%H%M%S%f") if ts else "0"
+        return f"{count}-{stamp}-{newest[0]['_id']}-{writes}"
+
+    return await _read_through(("version", collection_name), fetch)
+
+
+async def warmup_pool(connections: int = WARMUP_CONNECTIONS):
+    """Open connections up front so the first requests after a deploy skip the handshake."""
+    _ensure_db()
+    # Concurrent pings each need their own pooled connection
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, connections))))
+    return pool_stats.snapshot()
+
+
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    _ensure_db()
+    if isinstance(data, BaseModel):
+        data = data.model_dump()
+    doc = {**data}
+    now = datetime.now(timezone.utc)
+    doc.setdefault("created_at", now)
+    doc["updated_at"] = now
+    res = await db[collection_name].insert_one(doc)
+    read_cache.invalidate(collection_name)
+    return str(res.inserted_id)
+
+
+async def get_documents(collection_name: str, filter_dict: dict | None = None, limit: int | None = None, projection: dict | None = None):
+    _ensure_db()
+
+    async def fetch():
+        cur = db[collection_name].find(filter_dict or {}, projection).sort(LIST_SORT)
+        if limit:
+            cur = cur.limit(limit)
+        return await cur.to_list(length=None)
+
+    key = ("list", collection_name, query_key(filter_dict, limit, projection))
+    return await _read_through(key, fetch, lambda docs: len(docs) <= CACHE_MAX_LIST_LEN)
+
+
+async def get_documents_page(collection_name: str, filter_dict: dict | None = None, limit: int = 50,
+                             cursor: str | None = None, projection: dict | None = None):
+    """Return (docs, next_cursor); next_cursor is None on the last page."""
+    _ensure_db()
+    if projection:
+        projection = {**projection, "updated_at": 1}
+
+    async def fetch():
+        cur = db[collection_name].find(keyset_filter(filter_dict, cursor), projection).sort(LIST_SORT).limit(limit + 1)
+        docs = await cur.to_list(length=limit + 1)
+        if len(docs) <= limit:
+            return docs, None
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+
+    key = ("list", collection_name, query_key("page", filter_dict, limit, cursor, projection))
+    return await _read_through(key, fetch)
+
+
+def iter_documents(collection_name: str, filter_dict: dict | None = None, projection: dict | None = None,
+                   batch_size: int = 1000):
+    """Async cursor over every match, fetched batch_size at a time; bypasses the read cache."""
+    _ensure_db()
+    return db[collection_name].find(filter_dict or {}, projection).sort(LIST_SORT).batch_size(batch_size)
+
+
+async def count_documents(collection_name: str, filter_dict: dict | None = None) -> int:
+    """Uncached count; the whole collection's comes from its metadata."""
+    _ensure_db()
+    if not filter_dict:
+        return await db[collection_name].estimated_document_count()
+    return await db[collection_name].count_documents(filter_dict)
+
+
+async def get_document(collection_name: str, _id):
+    _ensure_db()
+    from bson import ObjectId
+    return await _read_through(
+        ("doc", collection_name, str(_id)),
+        lambda: db[collection_name].find_one({"_id": ObjectId(_id)}),
+        lambda doc: doc is not None,
+    )
+
+
+async def update_document(collection_name: str, _id, data: dict):
+    _ensure_db()
+    from bson import ObjectId
+    data["updated_at"] = datetime.now(timezone.utc)
+    await db[collection_name].update_one({"_id": ObjectId(_id)}, {"$set": data})
+    read_cache.invalidate(collection_name, [_id])
+    return True
+
+
+async def delete_document(collection_name: str, _id):
+    _ensure_db()
+    from bson import ObjectId
+    await db[collection_name].delete_one({"_id": ObjectId(_id)})
+    read_cache.invalidate(collection_name, [_id])
+    return True
+
+
+_transactions: bool | None = None
+
+
+async def _supports_transactions() -> bool:
+    # Multi-document transactions need a replica set or mongos; standalone servers say no
+    global _transactions
+    if _transactions is None:
+        try:
+            hello = await db.command("hello")
+            _transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _transactions = False
+    return _transactions
+
+
+async def delete_folder_cascade(folder_id: str, delete_notes: bool, move_to: str | None = None) -> dict:
+    """Delete a folder and, with one delete_many/update_many, delete or re-file its notes.
+    Runs in a transaction when the deployment supports them. Returns the folder's note ids."""
+    _ensure_db()
+    from bson import ObjectId
+
+    async def run(session=None):
+        note_ids = [d["_id"] async for d in db["note"].find({"folder_id": folder_id}, {"_id": 1}, session=session)]
+        if note_ids:
+            flt = {"_id": {"$in": note_ids}}
+            if delete_notes:
+                await db["note"].delete_many(flt, session=session)
+            else:
+                await db["note"].update_many(flt, {"$set": {"folder_id": move_to, "updated_at": datetime.now(timezone.utc)}}, session=session)
+        res = await db["folder"].delete_one({"_id": ObjectId(folder_id)}, session=session)
+        return {"deleted": res.deleted_count > 0, "note_ids": [str(i) for i in note_ids]}
+
+    try:
+        if await _supports_transactions():
+            async with await _client.start_session() as session:
+                async with session.start_transaction():
+                    return await run(session)
+        # Notes first: a failure part-way leaves the folder in place to retry against
+        return await run()
+    finally:
+        read_cache.invalidate("folder", [folder_id])
+        read_cache.invalidate_all("note")
+
+
+async def set_document_fields(collection_name: str, updates: list) -> int:
+    """$set derived fields on many documents in one bulk_write; updated_at is left alone.
+    updates: [(id, data)]"""
+    _ensure_db()
+    from bson import ObjectId
+    if not updates:
+        return 0
+    res = await db[collection_name].bulk_write([UpdateOne({"_id": ObjectId(_id)}, {"$set": data}) for _id, data in updates], ordered=False)
+    await _count_write(collection_name)
+    read_cache.invalidate(collection_name, [_id for _id, _ in updates])
+    return res.modified_count
+
+
+async def apply_counters(collection_name: str, updates: list) -> int:
+    """One bulk_write of {"$inc": inc, "$max": max} per (id, inc, max); updated_at is left alone."""
+    _ensure_db()
+    from bson import ObjectId
+    ops = []
+    for _id, inc, mx in updates:
+        update = {k: v for k, v in (("$inc", inc), ("$max", mx)) if v}
+        if update:
+            ops.append(UpdateOne({"_id": ObjectId(_id)}, update))
+    if not ops:
+        return 0
+    res = await db[collection_name].bulk_write(ops, ordered=False)
+    await _count_write(collection_name)
+    read_cache.invalidate(collection_name, [_id for _id, _, _ in updates])
+    return res.modified_count
+
+
+async def aggregate(collection_name: str, pipeline: list) -> list:
+    _ensure_db()
+    return await db[collection_name].aggregate(pipeline).to_list(length=None)
+
+
+# Bulk writes: one unordered bulk_write per call, with a result per input item.
+
+def _object_id(_id):
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    try:
+        return ObjectId(_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+async def _bulk_write(collection_name: str, ops: list) -> dict:
+    """Run ops unordered; return {op index: error message} for the ops that failed."""
+    if not ops:
+        return {}
+    try:
+        await db[collection_name].bulk_write(ops, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        if e.details.get("writeConcernErrors"):
+            raise
+        return {err["index"]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+
+
+async def _existing_ids(collection_name: str, oids: list) -> set:
+    cur = db[collection_name].find({"_id": {"$in": oids}}, {"_id": 1})
+    return {d["_id"] async for d in cur}
+
+
+def _result(_id, error: str | None) -> dict:
+    return {"id": str(_id), "ok": False, "error": error} if error else {"id": str(_id), "ok": True}
+
+
+async def create_documents(collection_name: str, items: list) -> list:
+    _ensure_db()
+    from bson import ObjectId
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        if isinstance(data, BaseModel):
+            data = data.model_dump()
+        doc = {**data, "_id": ObjectId()}
+        doc.setdefault("created_at", now)
+        doc["updated_at"] = now
+        docs.append(doc)
+    errors = await _bulk_write(collection_name, [InsertOne(d) for d in docs])
+    read_cache.invalidate(collection_name)
+    return [_result(d["_id"], errors.get(i)) for i, d in enumerate(docs)]
+
+
+async def _write_existing(collection_name: str, ids: list, make_op) -> list:
+    oids = [_object_id(_id) for _id in ids]
+    found = await _existing_ids(collection_name, [o for o in oids if o])
+    ops, positions, results = [], {}, []
+    for i, (_id, oid) in enumerate(zip(ids, oids)):
+        if oid is None or oid not in found:
+            results.append(_result(_id, "Invalid id" if oid is None else "Not found"))
+            continue
+        positions[len(ops)] = i
+        ops.append(make_op(i, oid))
+        results.append(_result(_id, None))
+    try:
+        errors = await _bulk_write(collection_name, ops)
+    finally:
+        read_cache.invalidate(collection_name, ids)
+    for op_index, error in errors.items():
+        i = positions[op_index]
+        results[i] = _result(ids[i], error)
+    return results
+
+
+async def update_documents(collection_name: str, updates: list) -> list:
+    """updates: [(id, data)]"""
+    _ensure_db()
+    now = datetime.now(timezone.utc)
+    return await _write_existing(
+        collection_name,
+        [_id for _id, _ in updates],
+        lambda i, oid: UpdateOne({"_id": oid}, {"$set": {**updates[i][1], "updated_at": now}}),
+    )
+
+
+async def delete_documents(collection_name: str, ids: list) -> list:
+    _ensure_db()
+    return await _write_existing(collection_name, ids, lambda i, oid: DeleteOne({"_id": oid}))
@@ -0,0 +1,89 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from database_async import apply_counters, aggregate, iter_documents, set_document_fields
+
+logger = logging.getLogger(__name__)
+
+# Per-folder note counters, kept on the folder document so GET /folders?with_counts=1 is
+# still a single query:
+#   "counts": {"notes": int, "last_updated_at": datetime}
+# Note writes adjust them with $inc/$max (no read-modify-write). They are not written in
+# the same transaction as the note, and last_updated_at is not lowered when notes leave,
+# so reconcile() rebuilds everything from a $group over the notes.
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def empty_counts() -> dict:
+    # last_updated_at is left out until a note lands, so $max always has a date to compare
+    return {"notes": 0}
+
+
+class CounterDeltas:
+    """Counter changes for a set of note writes, flushed as one bulk_write over the folders."""
+
+    def __init__(self):
+        self._inc = defaultdict(int)
+        self._max = {}
+
+    def change(self, before: dict | None, after: dict | None):
+        """Record a note going from before to after (None for create / delete)."""
+        if before and before.get("folder_id"):
+            self._inc[before["folder_id"]] -= 1
+        if after and after.get("folder_id"):
+            self._inc[after["folder_id"]] += 1
+            self._max[after["folder_id"]] = datetime.now(timezone.utc)
+
+    async def flush(self):
+        from bson import ObjectId
+        folders = set(self._inc) | set(self._max)
+        updates = [
+            (folder_id, {"counts.notes": self._inc[folder_id]} if self._inc.get(folder_id) else {}, {"counts.last_updated_at": self._max[folder_id]} if folder_id in self._max else {})
+            for folder_id in folders
+            if ObjectId.is_valid(folder_id)
+        ]
+        self._inc.clear()
+        self._max.clear()
+        try:
+            await apply_counters("folder", updates)
+        except Exception as e:
+            # The note write already happened; reconcile() repairs the drift
+            logger.error("Folder counter update failed: %s", e)
+
+
+async def record_changes(changes: list):
+    deltas = CounterDeltas()
+    for before, after in changes:
+        deltas.change(before, after)
+    await deltas.flush()
+
+
+async def reconcile() -> dict:
+    """Recompute every folder's counters from the notes themselves."""
+    rows = await aggregate("note", [
+        {"$match": {"folder_id": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$folder_id", "notes": {"$sum": 1}, "last_updated_at": {"$max": "$updated_at"}}},
+    ])
+    counts = {}
+    for row in rows:
+        c = counts[row["_id"]] = {"notes": row["notes"]}
+        if row["last_updated_at"] is not None:
+            c["last_updated_at"] = row["last_updated_at"]
+    folders = notes = 0
+    batch = []
+    async for folder in iter_documents("folder", {}, {"_id": 1}, batch_size=RECONCILE_BATCH_SIZE):
+        c = counts.get(str(folder["_id"])) or empty_counts()
+        batch.append((folder["_id"], {"counts": c}))
+        folders += 1
+        notes += c["notes"]
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            await set_document_fields("folder", batch)
+            batch = []
+    await set_document_fields("folder", batch)
+    return {"folders": folders, "notes": notes}
+
+
+def counts_out(folder: dict) -> dict:
+    return {"notes": 0, "last_updated_at": None, **(folder.get("counts") or {})}
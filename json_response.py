@@ -0,0 +1,22 @@
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+# orjson-backed response for large listings. Datetimes are encoded natively (UTC as "Z",
+# same as pydantic) and routes return it directly, so FastAPI skips response_model
+# validation and jsonable_encoder.
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Base for the in-process indexes behind /ai/search (inverted index, TF-IDF engine, vector
+# store). Each is built from the note collection on first use, then kept current by the
+# note write paths:
+#
+#   begin_load()       from here on, writes are queued instead of applied
+#   load_batch(docs)   index a batch of scanned notes
+#   finish_load(docs)  index the last batch, replay the queued writes, mark loaded
+#   add_many() / remove_many()
+#                      apply a batch of writes, or queue it while the load is in flight
+#
+# ensure_loaded() streams the scan LOAD_BATCH notes at a time and indexes each batch in the
+# default executor, not on the event loop, so neither the corpus nor the build is ever held
+# up front. The build itself does not hold the lock (nothing reads the structures before
+# loaded is set, and writes only touch the queue), so writes and stats never wait on it.
+#
+# Upkeep that writes make due (segment merges, compaction, retraining) is not done by the
+# write itself: it runs on the index's own maintenance thread, one pass at a time.
+#
+# Writes made by other processes reach the index through sync(): notes whose updated_at is
+# newer than the version the index holds are re-indexed, and notes gone from the collection
+# are dropped. Each note's version is its updated_at as loaded, or the time this process
+# indexed it. Comparing those across processes assumes their clocks agree to within
+# SYNC_SKEW_SECONDS, the slack the changed-notes query is given.
+#
+# Subclasses implement _add / _remove and may hook _begin_load, _load, _after_load,
+# _prepare / _add_batch (batched writes), _maintenance_due and _maintain, and keep note
+# versions themselves through _mark_written / _is_current / _indexed. version is bumped by
+# every write or maintenance pass applied, so results can be cached per version.
+
+LOAD_BATCH = 5000
+SYNC_SKEW_SECONDS = float(os.getenv("INDEX_SYNC_SKEW_SECONDS", 10))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def stamp(dt: datetime | None) -> int:
+    # updated_at as epoch milliseconds, the precision Mongo stores
+    if dt is None:
+        return 0
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(milliseconds=1)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class LiveIndex(ABC):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = asyncio.Lock()
+        self._pending: List[Tuple[str, tuple]] | None = None
+        self._maintenance: ThreadPoolExecutor | None = None
+        self._maintenance_queued = False
+        # doc_id -> version (epoch ms) of the note as indexed
+        self._written: Dict[str, int] = {}
+        # Start of the last load or sync: later writes by others are not in the index yet
+        self.synced_at = 0
+        # Corpus version: bumped by every write and maintenance pass the index applies
+        self.version = 0
+        self.loaded = False
+
+    async def ensure_loaded(self, scan: Callable[[], AsyncIterable[Dict[str, Any]]]):
+        """Build the index once from scan(), a stream of the notes as {_id, title, content, ...}."""
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            loop = asyncio.get_running_loop()
+            self.begin_load()
+            batch = []
+            async for d in scan():
+                batch.append(d)
+                if len(batch) >= LOAD_BATCH:
+                    await loop.run_in_executor(None, self.load_batch, batch)
+                    batch = []
+            await loop.run_in_executor(None, self.finish_load, batch)
+
+    def begin_load(self):
+        # Writes that land while the initial scan is in flight are replayed by finish_load
+        with self._lock:
+            if not self.loaded:
+                self._begin_load()
+                self._pending = []
+                self.synced_at = now_ms()
+
+    # One loader at a time (ensure_loaded holds _load_lock)
+    def load_batch(self, docs: Iterable[Dict[str, Any]]):
+        if not self.loaded:
+            self._load(docs)
+
+    def finish_load(self, docs: Iterable[Dict[str, Any]] = ()):
+        if self.loaded:
+            return
+        self._load(docs)
+        self._after_load()
+        with self._lock:
+            # Queued writes land on top of the finished build
+            for op, args in self._pending or []:
+                getattr(self, op)(*args)
+            self._pending = None
+            self.loaded = True
+            self.version += 1
+        self._schedule_maintenance()
+
+    def add(self, doc_id: str, title: str | None, content: str | None):
+        self.add_many([(doc_id, title, content)])
+
+    def add_many(self, docs: Iterable[Tuple[str, str | None, str | None]]):
+        """Index (doc_id, title, content) triples, replacing earlier versions of the same ids."""
+        docs = [(doc_id, title or "", content or "") for doc_id, title, content in docs]
+        if not docs:
+            return
+        # Work a write needs no index state for (embedding, say) happens outside the lock
+        batch = self._prepare(docs)
+        ids = [doc_id for doc_id, _, _ in docs]
+        with self._lock:
+            if self.loaded:
+                self._apply(batch, ids)
+                self.version += 1
+            elif self._pending is not None:
+                self._pending.append(("_apply", (batch, ids)))
+        self._schedule_maintenance()
+
+    def remove(self, doc_id: str):
+        self.remove_many([doc_id])
+
+    def remove_many(self, doc_ids: Iterable[str]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._lock:
+            for doc_id in doc_ids:
+                if self.loaded:
+                    self._drop(doc_id)
+                elif self._pending is not None:
+                    self._pending.append(("_drop", (doc_id,)))
+            if self.loaded:
+                self.version += 1
+        self._schedule_maintenance()
+
+    def _apply(self, batch: Any, doc_ids: List[str]):
+        self._add_batch(batch)
+        self._mark_written(doc_ids)
+
+    def _drop(self, doc_id: str):
+        self._remove(doc_id)
+        self._written.pop(doc_id, None)
+
+    # -------- sync --------
+
+    async def sync(
+        self,
+        changed: Callable[[datetime], AsyncIterable[Dict[str, Any]]],
+        count: Callable[[], Awaitable[int]],
+        ids: Callable[[], AsyncIterable[Dict[str, Any]]],
+    ):
+        """Catch up with writes made elsewhere: re-index what changed(since) streams (the notes
+        updated since, as {_id, title, content, updated_at}) where it is newer than the
+        indexed version, then, if the index and count() disagree, drop the notes ids() no
+        longer lists. Does nothing before the index is loaded."""
+        if not self.loaded:
+            return
+        loop = asyncio.get_running_loop()
+        started = now_ms()
+        since = datetime.fromtimestamp(self.synced_at / 1000 - SYNC_SKEW_SECONDS, timezone.utc)
+        batch = []
+        async for d in changed(since):
+            batch.append(d)
+            if len(batch) >= LOAD_BATCH:
+                await loop.run_in_executor(None, self.catch_up, batch)
+                batch = []
+        await loop.run_in_executor(None, self.catch_up, batch)
+        if await count() != len(self):
+            present = {str(d["_id"]) async for d in ids()}
+            await loop.run_in_executor(None, self.drop_missing, present, started)
+        self.synced_at = started
+
+    def catch_up(self, docs: Iterable[Dict[str, Any]]):
+        # Checked and applied under the lock, so a newer local write cannot land in between
+        with self._lock:
+            stale = [
+                (str(d["_id"]), d.get("title"), d.get("content"))
+                for d in docs
+                if not self._is_current(str(d["_id"]), stamp(d.get("updated_at")))
+            ]
+            self.add_many(stale)
+
+    def drop_missing(self, present: Set[str], before: int):
+        # Notes indexed since `before` may postdate the id scan
+        with self._lock:
+            self.remove_many([doc_id for doc_id, ts in self._indexed() if ts < before and doc_id not in present])
+
+    # -------- maintenance --------
+
+    def _schedule_maintenance(self):
+        with self._lock:
+            if not self.loaded or self._maintenance_queued or not self._maintenance_due():
+                return
+            if self._maintenance is None:
+                self._maintenance = ThreadPoolExecutor(1, thread_name_prefix=f"{type(self).__name__}-maintenance")
+            self._maintenance_queued = True
+            self._maintenance.submit(self._run_maintenance)
+
+    def _run_maintenance(self):
+        try:
+            with self._lock:
+                self._maintenance_queued = False
+                if not self.loaded:
+                    return
+            self._maintain()
+            with self._lock:
+                self.version += 1
+        except Exception:
+            logger.exception("%s maintenance failed", type(self).__name__)
+
+    def stop_maintenance(self):
+        """Wait out a running maintenance pass; a later write that makes one due starts a new thread."""
+        with self._lock:
+            executor, self._maintenance = self._maintenance, None
+            self._maintenance_queued = False
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    # -------- hooks --------
+
+    def _begin_load(self):
+        pass
+
+    def _load(self, docs: Iterable[Dict[str, Any]]):
+        for d in docs:
+            doc_id = str(d.get("_id"))
+            self._add(doc_id, d.get("title") or "", d.get("content") or "")
+            self._written[doc_id] = stamp(d.get("updated_at"))
+
+    def _after_load(self):
+        pass
+
+    def _prepare(self, docs: List[Tuple[str, str, str]]) -> Any:
+        # Runs without the lock; what it returns is handed to _add_batch
+        return docs
+
+    def _add_batch(self, batch: Any):
+        for doc_id, title, content in batch:
+            self._add(doc_id, title, content)
+
+    def _mark_written(self, doc_ids: List[str]):
+        ts = now_ms()
+        for doc_id in doc_ids:
+            self._written[doc_id] = ts
+
+    def _is_current(self, doc_id: str, ts: int) -> bool:
+        return self._written.get(doc_id, -1) >= ts
+
+    def _indexed(self) -> Iterable[Tuple[str, int]]:
+        return self._written.items()
+
+    def _maintenance_due(self) -> bool:
+        # Checked under the lock after writes
+        return False
+
+    def _maintain(self):
+        # Runs on the maintenance thread, not under the lock: take it around shared state
+        pass
+
+    @abstractmethod
+    def _add(self, doc_id: str, title: str, content: str):
+        ...
+
+    @abstractmethod
+    def _remove(self, doc_id: str):
+        ...
+
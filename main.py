@@ -1,25 +1,35 @@
+import asyncio
+import logging
 import os
+import zlib
+from datetime import datetime
 from io import BytesIO
 from typing import List
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 
 from schemas import (
     FolderCreate, FolderOut, NoteCreate, NoteUpdate, NoteOut,
     AIRewriteRequest, AIIdeasRequest, AISearchRequest,
-    TranscriptionRequest, ExportPDFRequest
+    TranscriptionRequest, ExportPDFRequest,
+    NoteBatchCreate, NoteBatchUpdate, NoteBatchDelete,
 )
-from database import db, create_document, get_documents, get_document, update_document, delete_document
-
-# Optional: simple TF-IDF-like search stub
+from database import ensure_indexes, index_report
+from database_async import (
+    db, pool_stats, warmup_pool, collection_version, create_document, get_documents, get_documents_page, get_document, iter_documents, update_document, delete_document,
+    count_documents, create_documents, update_documents, delete_documents, delete_folder_cascade,
+)
+from search_index import note_index, RANKERS
+import folder_counts
+from cache import read_cache, search_cache, normalize_query, MISSING
+from json_response import FastJSONResponse, dumps
+from pdf_render import pdf_cache, cached_pdf, render_pdf, render_notes_pdf, pdf_filename, content_disposition, stream_zip, shutdown_pool
 
-def simple_score(text: str, query: str) -> float:
-    text = (text or "").lower()
-    q = query.lower().split()
-    return sum(text.count(w) for w in q) / (len(text) + 1)
+logger = logging.getLogger(__name__)
 
 
 app = FastAPI(title="Dear Diary API")
@@ -30,87 +40,331 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Keyset pages: ?limit=N[&cursor=...]; the next page's cursor comes back in X-Next-Cursor
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+async def _list_page(response: Response, collection: str, filt: dict, limit: int | None, cursor: str | None, projection: dict | None = None):
+    if limit is None and cursor is None:
+        return await get_documents(collection, filt, projection=projection)
+    try:
+        docs, next_cursor = await get_documents_page(collection, filt, limit or DEFAULT_PAGE_SIZE, cursor, projection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
+
+
+# Conditional GETs: weak ETags from the collection's version. A matching
+# If-None-Match gets a 304 before the listing is queried or anything is serialized.
+async def _etag(collection: str) -> str:
+    return f'W/"{await collection_version(collection)}"'
+
+
+def _not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    # Weak comparison: W/ prefixes are ignored on both sides
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+@app.on_event("startup")
+async def startup():
+    if db is None:
+        return
+    try:
+        await run_in_threadpool(ensure_indexes)
+    except Exception as e:
+        logger.error("Index setup failed: %s", e)
+    try:
+        await warmup_pool()
+    except Exception as e:
+        logger.error("Connection pool warmup failed: %s", e)
+    try:
+        # Folders from before the counters existed get them built once, off the startup path
+        if await get_documents("folder", {"counts": {"$exists": False}}, limit=1):
+            asyncio.create_task(_reconcile_folder_counts())
+    except Exception as e:
+        logger.error("Folder counter check failed: %s", e)
+    global _index_sync
+    if INDEX_SYNC_SECONDS > 0:
+        _index_sync = asyncio.create_task(_sync_note_index())
+
+
+async def _reconcile_folder_counts():
+    try:
+        result = await folder_counts.reconcile()
+        logger.info("Folder counters rebuilt: %s", result)
+    except Exception as e:
+        logger.error("Folder counter reconcile failed: %s", e)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if _index_sync is not None:
+        _index_sync.cancel()
+    shutdown_pool()
+
 
 @app.get("/")
 def root():
     return {"message": "Dear Diary backend is running"}
 
 
+@app.get("/stats")
+def stats():
+    return {"pool": pool_stats.snapshot(), "cache": read_cache.stats(), "search_cache": search_cache.stats(), "pdf": pdf_cache.stats()}
+
+
 # Folders CRUD
 @app.post("/folders", response_model=dict)
-def create_folder(folder: FolderCreate):
+async def create_folder(folder: FolderCreate):
     try:
-        folder_id = create_document("folder", folder)
+        folder_id = await create_document("folder", {**folder.model_dump(), "counts": folder_counts.empty_counts()})
         return {"id": folder_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/folders", response_model=List[dict])
-def list_folders():
+async def list_folders(request: Request, response: Response, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None, with_counts: bool = False):
+    not_modified = _not_modified(request, response, await _etag("folder"))
+    if not_modified:
+        return not_modified
     try:
-        docs = get_documents("folder")
+        docs = await _list_page(response, "folder", {}, limit, cursor)
         out = []
         for d in docs:
-            out.append({
+            folder = {
                 "id": str(d.get("_id")),
                 "name": d.get("name"),
                 "color": d.get("color"),
                 "created_at": d.get("created_at"),
                 "updated_at": d.get("updated_at"),
-            })
+            }
+            # Counters live on the folder documents, so this stays one query either way
+            if with_counts:
+                folder["counts"] = folder_counts.counts_out(d)
+            out.append(folder)
         return out
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ?notes=delete removes the folder's notes, ?move_to=<folder id> re-files them; by default
+# they are left unfiled (folder_id null). Either way it is one server-side write.
 @app.delete("/folders/{folder_id}")
-def delete_folder_route(folder_id: str):
+async def delete_folder_route(folder_id: str, notes: str | None = None, move_to: str | None = None):
+    if notes not in (None, "delete") or (notes and move_to):
+        raise HTTPException(status_code=400, detail="Use either notes=delete or move_to=<folder id>")
+    if move_to == folder_id:
+        raise HTTPException(status_code=400, detail="Cannot move notes into the folder being deleted")
     try:
-        delete_document("folder", folder_id)
-        return {"ok": True}
+        if not await get_document("folder", folder_id):
+            raise HTTPException(status_code=404, detail="Folder not found")
+        if move_to and not await get_document("folder", move_to):
+            raise HTTPException(status_code=404, detail="Target folder not found")
+        result = await delete_folder_cascade(folder_id, notes == "delete", move_to)
+        if move_to:
+            await folder_counts.record_changes([(None, {"folder_id": move_to})] * len(result["note_ids"]))
+        if notes == "delete":
+            note_index.remove_many(result["note_ids"])
+            return {"ok": True, "notes_deleted": len(result["note_ids"])}
+        return {"ok": True, "notes_moved": len(result["note_ids"])}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Notes CRUD
 @app.post("/notes", response_model=dict)
-def create_note(note: NoteCreate):
+async def create_note(note: NoteCreate):
     try:
-        note_id = create_document("note", note)
+        note_id = await create_document("note", note)
+        note_index.add(note_id, note.title, note.content)
+        await folder_counts.record_changes([(None, {"folder_id": note.folder_id})])
         return {"id": note_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/notes", response_model=List[dict])
-def list_notes(folder_id: str | None = None):
+# Batch endpoints: one unordered bulk_write per request, one result per item.
+# Declared before /notes/{note_id} so "batch" is not taken for an id.
+@app.post("/notes/batch", response_model=dict)
+async def create_notes_batch(batch: NoteBatchCreate):
+    try:
+        results = await create_documents("note", batch.items)
+        note_index.add_many([(r["id"], note.title, note.content) for note, r in zip(batch.items, results) if r["ok"]])
+        await folder_counts.record_changes([(None, {"folder_id": note.folder_id}) for note, r in zip(batch.items, results) if r["ok"]])
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.patch("/notes/batch", response_model=dict)
+async def update_notes_batch(batch: NoteBatchUpdate):
+    try:
+        updates = [
+            (item.id, {k: v for k, v in item.model_dump(exclude={"id"}).items() if v is not None})
+            for item in batch.items
+        ]
+        # Current state: the folder counters need the old folder, the index the merged text
+        current = await _notes_by_id([_id for _id, _ in updates], {"title": 1, "content": 1, "folder_id": 1})
+        results = await update_documents("note", updates)
+        changes, reindex = [], []
+        for r, (_id, data) in zip(results, updates):
+            if r["ok"] and _id in current:
+                merged = {**current[_id], **data}
+                changes.append((current[_id], merged))
+                if "title" in data or "content" in data:
+                    reindex.append((_id, merged.get("title", ""), merged.get("content", "")))
+        note_index.add_many(reindex)
+        await folder_counts.record_changes(changes)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/notes/batch", response_model=dict)
+async def delete_notes_batch(batch: NoteBatchDelete):
+    try:
+        current = await _notes_by_id(batch.ids, {"folder_id": 1})
+        results = await delete_documents("note", batch.ids)
+        note_index.remove_many([r["id"] for r in results if r["ok"]])
+        await folder_counts.record_changes([(current[r["id"]], None) for r in results if r["ok"] and r["id"] in current])
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _notes_by_id(ids: list, projection: dict) -> dict:
+    from bson import ObjectId
+    oids = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+    if not oids:
+        return {}
+    return {str(d["_id"]): d for d in await get_documents("note", {"_id": {"$in": oids}}, projection=projection)}
+
+
+# Listing projections: ?fields=title,tags or ?view=summary (preview instead of full content)
+NOTE_FIELDS = ("title", "content", "folder_id", "tags", "header_style", "created_at", "updated_at")
+NOTE_DEFAULTS = {"content": "", "tags": [], "header_style": "soft"}
+SUMMARY_FIELDS = ("title", "folder_id", "tags", "header_style", "created_at", "updated_at", "preview")
+PREVIEW_LEN = 200
+
+
+def _note_fields(fields: str | None, view: str) -> tuple:
+    if fields:
+        requested = tuple(f.strip() for f in fields.split(",") if f.strip() and f.strip() != "id")
+        unknown = set(requested) - set(NOTE_FIELDS) - {"preview"}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        return requested
+    if view == "summary":
+        return SUMMARY_FIELDS
+    if view == "full":
+        return NOTE_FIELDS
+    raise HTTPException(status_code=400, detail=f"Unknown view: {view}")
+
+
+def _note_projection(fields: tuple) -> dict:
+    proj = {}
+    for f in fields:
+        if f == "preview":
+            # Truncated server-side so the full content never leaves Mongo
+            content = {"$ifNull": ["$content", ""]}
+            proj["preview"] = {"$substrCP": [content, 0, PREVIEW_LEN]}
+            proj["preview_truncated"] = {"$gt": [{"$strLenCP": content}, PREVIEW_LEN]}
+        else:
+            proj[f] = 1
+    return proj
+
+
+def _note_out(d: dict, fields: tuple) -> dict:
+    out = {"id": str(d.get("_id"))}
+    for f in fields:
+        if f == "preview":
+            out["preview"] = d.get("preview", "") + ("…" if d.get("preview_truncated") else "")
+        else:
+            out[f] = d.get(f, NOTE_DEFAULTS.get(f))
+    return out
+
+
+@app.get("/notes", response_model=List[dict], response_class=FastJSONResponse)
+async def list_notes(request: Request, response: Response, folder_id: str | None = None, fields: str | None = None, view: str = "full",
+                     limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None):
+    selected = _note_fields(fields, view)
+    not_modified = _not_modified(request, response, await _etag("note"))
+    if not_modified:
+        return not_modified
     try:
         filt = {"folder_id": folder_id} if folder_id else {}
-        docs = get_documents("note", filt)
-        out = []
-        for d in docs:
-            out.append({
-                "id": str(d.get("_id")),
-                "title": d.get("title"),
-                "content": d.get("content", ""),
-                "folder_id": d.get("folder_id"),
-                "tags": d.get("tags", []),
-                "header_style": d.get("header_style", "soft"),
-                "created_at": d.get("created_at"),
-                "updated_at": d.get("updated_at"),
-            })
-        return out
+        projection = None if selected == NOTE_FIELDS else _note_projection(selected)
+        docs = await _list_page(response, "note", filt, limit, cursor, projection)
+        # Returned as a response so the list is not re-validated and re-encoded
+        return FastJSONResponse([_note_out(d, selected) for d in docs], headers=dict(response.headers))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Full export, one JSON note per line, streamed off the cursor so memory stays flat
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+async def _ndjson_chunks(cur, compress: bool):
+    # gzip framing (wbits=31) so the output is a regular .gz file
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf = bytearray()
+    async for d in cur:
+        buf += dumps(_note_out(d, NOTE_FIELDS))
+        buf += b"\n"
+        if len(buf) >= EXPORT_CHUNK_BYTES:
+            chunk = gz.compress(bytes(buf)) if gz else bytes(buf)
+            buf.clear()
+            if chunk:
+                yield chunk
+    tail = gz.compress(bytes(buf)) + gz.flush() if gz else bytes(buf)
+    if tail:
+        yield tail
+
+
+@app.get("/notes/export.ndjson")
+async def export_notes_ndjson(folder_id: str | None = None, gzip: bool = False):
+    try:
+        cur = iter_documents("note", {"folder_id": folder_id} if folder_id else {}, batch_size=EXPORT_BATCH_SIZE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    filename = "notes.ndjson.gz" if gzip else "notes.ndjson"
+    return StreamingResponse(
+        _ndjson_chunks(cur, gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @app.get("/notes/{note_id}", response_model=dict)
-def get_note(note_id: str):
+async def get_note(note_id: str, request: Request, response: Response):
+    not_modified = _not_modified(request, response, await _etag("note"))
+    if not_modified:
+        return not_modified
     try:
-        d = get_document("note", note_id)
+        d = await get_document("note", note_id)
         if not d:
             raise HTTPException(status_code=404, detail="Note not found")
         return {
@@ -130,24 +384,65 @@ def get_note(note_id: str):
 
 
 @app.patch("/notes/{note_id}")
-def update_note(note_id: str, update: NoteUpdate):
+async def update_note(note_id: str, update: NoteUpdate):
     try:
         data = {k: v for k, v in update.model_dump().items() if v is not None}
-        update_document("note", note_id, data)
+        d = await get_document("note", note_id)
+        await update_document("note", note_id, data)
+        if d:
+            merged = {**d, **data}
+            if "title" in data or "content" in data:
+                note_index.add(note_id, merged.get("title", ""), merged.get("content", ""))
+            await folder_counts.record_changes([(d, merged)])
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/notes/{note_id}")
-def delete_note(note_id: str):
+async def delete_note(note_id: str):
     try:
-        delete_document("note", note_id)
+        d = await get_document("note", note_id)
+        await delete_document("note", note_id)
+        note_index.remove(note_id)
+        if d:
+            await folder_counts.record_changes([(d, None)])
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# The search index is built from the collection on first use, streamed off a cursor
+INDEXED_NOTE_FIELDS = {"title": 1, "content": 1, "updated_at": 1}
+
+
+async def _ensure_note_index():
+    await note_index.ensure_loaded(lambda: iter_documents("note", {}, INDEXED_NOTE_FIELDS))
+
+
+# Note writes made by other workers reach the loaded index through a periodic sync, run
+# whenever the collection version has moved (see LiveIndex.sync). 0 turns it off.
+INDEX_SYNC_SECONDS = float(os.getenv("INDEX_SYNC_SECONDS", 10))
+_index_sync: asyncio.Task | None = None
+
+
+def _changed_notes(since: datetime):
+    return iter_documents("note", {"updated_at": {"$gte": since}}, INDEXED_NOTE_FIELDS)
+
+
+async def _sync_note_index():
+    synced = None
+    while True:
+        await asyncio.sleep(INDEX_SYNC_SECONDS)
+        try:
+            version = await collection_version("note")
+            if version != synced:
+                await note_index.sync(_changed_notes, lambda: count_documents("note"), lambda: iter_documents("note", {}, {"_id": 1}))
+                synced = version
+        except Exception as e:
+            logger.error("Search index sync failed: %s", e)
+
+
 # AI stubs
 @app.post("/ai/rewrite")
 def ai_rewrite(req: AIRewriteRequest):
@@ -193,27 +488,29 @@ def ai_ideas(req: AIIdeasRequest):
 
 
 @app.post("/ai/search")
-def ai_search(req: AISearchRequest):
-    # naive semantic-ish search over notes
+async def ai_search(req: AISearchRequest):
+    # ranked lookup over the in-process inverted index
+    if req.ranker not in RANKERS:
+        raise HTTPException(status_code=400, detail=f"Unknown ranker: {req.ranker}")
     try:
-        docs = get_documents("note")
-        scored = []
-        for d in docs:
-            text = f"{d.get('title','')}\n{d.get('content','')}"
-            score = simple_score(text, req.query)
-            scored.append((score, d))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top = [
-            {
-                "id": str(d.get("_id")),
-                "title": d.get("title"),
-                "snippet": (d.get("content", "")[:200] + ("…" if len(d.get("content", ""))>200 else "")),
-                "score": float(s),
-            }
-            for s, d in scored[:10]
-            if s > 0
-        ]
-        return {"results": top}
+        await _ensure_note_index()
+        # Repeats between note writes are served from the result cache
+        key = ("search", note_index.version, req.ranker, req.fuzzy, normalize_query(req.query))
+        cached = search_cache.get(key)
+        if cached is not MISSING:
+            return {"results": cached}
+        results = await run_in_threadpool(note_index.search, req.query, k=10, ranker=req.ranker, fuzzy=req.fuzzy)
+        search_cache.put(key, results)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Rebuild every folder's counters from the notes (repairs drift from failed counter writes)
+@app.post("/admin/reconcile-folder-counts")
+async def reconcile_folder_counts():
+    try:
+        return await folder_counts.reconcile()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -228,40 +525,63 @@ def transcribe(req: TranscriptionRequest):
 
 # PDF Export
 @app.post("/export/pdf")
-def export_pdf(req: ExportPDFRequest):
+async def export_pdf(req: ExportPDFRequest):
     try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import inch
-
-        d = get_document("note", req.note_id)
+        d = await get_document("note", req.note_id)
         if not d:
             raise HTTPException(status_code=404, detail="Note not found")
         title = req.title or d.get("title", "Untitled")
-        content = d.get("content", "")
-
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(1 * inch, height - 1 * inch, title[:80])
-
-        c.setFont("Helvetica", 11)
-        y = height - 1.3 * inch
-        for line in content.splitlines() or [""]:
-            if y < 1 * inch:
-                c.showPage()
-                y = height - 1 * inch
-                c.setFont("Helvetica", 11)
-            c.drawString(1 * inch, y, line[:95])
-            y -= 14
-
-        c.showPage()
-        c.save()
-        buffer.seek(0)
+        key = (req.note_id, str(d.get("updated_at")), title)
+        pdf = await cached_pdf(key, render_pdf, title, d.get("content", ""))
         headers = {"Content-Disposition": f"attachment; filename=note.pdf"}
-        return StreamingResponse(buffer, media_type="application/pdf", headers=headers)
+        return StreamingResponse(BytesIO(pdf), media_type="application/pdf", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Whole-folder export: one multi-page PDF, or a ZIP with a PDF per note that is
+# rendered in parallel and streamed entry by entry as renders finish. The single PDF is
+# one render held in memory, so it is only offered up to FOLDER_PDF_MAX_NOTES notes.
+FOLDER_EXPORT_FORMATS = ("pdf", "zip")
+FOLDER_PDF_MAX_NOTES = int(os.getenv("FOLDER_PDF_MAX_NOTES", 200))
+NOTE_EXPORT_PROJECTION = {"title": 1, "content": 1, "updated_at": 1}
+
+
+async def _zip_entries(cur):
+    async for d in cur:
+        note_id = str(d["_id"])
+        title = d.get("title") or "Untitled"
+        # Same cache key as /export/pdf, so notes exported one by one are reused
+        yield pdf_filename(title, note_id), (note_id, str(d.get("updated_at")), title), title, d.get("content", "")
+
+
+@app.get("/export/folder/{folder_id}")
+async def export_folder(folder_id: str, format: str = "pdf"):
+    if format not in FOLDER_EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    try:
+        folder = await get_document("folder", folder_id)
+        if not folder:
+            raise HTTPException(status_code=404, detail="Folder not found")
+        cur = iter_documents("note", {"folder_id": folder_id}, NOTE_EXPORT_PROJECTION, batch_size=EXPORT_BATCH_SIZE)
+        filename = pdf_filename(folder.get("name"), folder_id)[:-len(".pdf")]
+        if format == "zip":
+            headers = {"Content-Disposition": content_disposition(f"{filename}.zip")}
+            return StreamingResponse(stream_zip(_zip_entries(cur)), media_type="application/zip", headers=headers)
+        docs = []
+        async for d in cur:
+            docs.append(d)
+            if len(docs) > FOLDER_PDF_MAX_NOTES:
+                raise HTTPException(status_code=400, detail=f"Folder has more than {FOLDER_PDF_MAX_NOTES} notes; export it with format=zip")
+        notes = [(d.get("title") or "Untitled", d.get("content", "")) for d in docs] or [(folder.get("name") or "Untitled", "")]
+        key = ("folder", folder_id) + tuple((str(d["_id"]), str(d.get("updated_at")), n[0]) for d, n in zip(docs, notes))
+        pdf = await cached_pdf(key, render_notes_pdf, notes)
+        headers = {"Content-Disposition": content_disposition(f"{filename}.pdf")}
+        return StreamingResponse(BytesIO(pdf), media_type="application/pdf", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -278,7 +598,7 @@ def export_notion():
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     resp = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -289,7 +609,8 @@ def test_database():
     try:
         if db is not None:
             resp["database"] = "✅ Connected"
-            resp["collections"] = db.list_collection_names()
+            resp["collections"] = await db.list_collection_names()
+            resp["indexes"] = index_report
     except Exception as e:
         resp["database"] = f"⚠️ {str(e)[:60]}"
     return resp
@@ -32,6 +32,21 @@ class NoteOut(NoteCreate):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+# Batch note endpoints (one bulk_write per request)
+MAX_BATCH_SIZE = 5000
+
+class NoteBatchCreate(BaseModel):
+    items: List[NoteCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NoteBatchUpdateItem(NoteUpdate):
+    id: str
+
+class NoteBatchUpdate(BaseModel):
+    items: List[NoteBatchUpdateItem] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NoteBatchDelete(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
 # AI endpoints
 class AIRewriteRequest(BaseModel):
     text: str
@@ -44,6 +59,8 @@ class AIIdeasRequest(BaseModel):
 
 class AISearchRequest(BaseModel):
     query: str
+    ranker: str = Field("tf", description="tf|bm25")
+    fuzzy: bool = Field(True, description="match misspelled terms against similar indexed ones")
 
 # Transcription
 class TranscriptionRequest(BaseModel):
@@ -0,0 +1,198 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+
+from live_index import LiveIndex
+from snippets import token_starts, highlight_spans, make_snippet
+from trigram_index import TrigramIndex
+
+# In-process inverted index over notes for /ai/search.
+# Built once from the collection on first use, then kept current by the note write paths
+# (see LiveIndex). Query terms the index has never seen are matched fuzzily
+# against its vocabulary through a trigram index. Content term positions are kept so each
+# hit's snippet is the window around its matches, cut without re-tokenizing the note.
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# BM25 parameters; title hits count double by default
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+
+RANKERS = ("tf", "bm25")
+
+
+def tokenize(text: str) -> List[str]:
+    return [term for term, _ in token_starts(text or "", _TOKEN_RE)]
+
+
+class InvertedIndex(LiveIndex):
+    def __init__(self, k1: float = K1, b: float = B, title_weight: float = TITLE_WEIGHT, content_weight: float = CONTENT_WEIGHT):
+        super().__init__()
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.content_weight = content_weight
+        # term -> {doc_id: (title tf, content tf)}
+        self._postings: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        # doc_id -> {"title", "content", "positions", "length", "field_length", "terms"};
+        # positions maps each content term to its start offsets
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        # term -> (max weighted tf, min field length) over its postings, for BM25 upper bounds
+        self._term_stats: Dict[str, Tuple[float, float]] = {}
+        self._trigrams = TrigramIndex()
+        self._total_field_length = 0.0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add(self, doc_id: str, title: str, content: str):
+        self._remove(doc_id)
+        title_tokens = tokenize(title)
+        title_counts = Counter(title_tokens)
+        positions: Dict[str, List[int]] = {}
+        for term, start in token_starts(content, _TOKEN_RE):
+            positions.setdefault(term, []).append(start)
+        content_counts = {term: len(starts) for term, starts in positions.items()}
+        terms = title_counts.keys() | content_counts.keys()
+        for term in terms:
+            if term not in self._postings:
+                self._trigrams.add(term)
+            self._postings.setdefault(term, {})[doc_id] = (title_counts.get(term, 0), content_counts.get(term, 0))
+            self._term_stats.pop(term, None)
+        field_length = self.title_weight * len(title_tokens) + self.content_weight * sum(content_counts.values())
+        self._total_field_length += field_length
+        self._docs[doc_id] = {
+            "title": title,
+            "content": content,
+            "positions": {term: tuple(starts) for term, starts in positions.items()},
+            "length": len(title) + 1 + len(content),
+            "field_length": field_length,
+            "terms": tuple(terms),
+        }
+
+    def _remove(self, doc_id: str):
+        meta = self._docs.pop(doc_id, None)
+        if not meta:
+            return
+        self._total_field_length -= meta["field_length"]
+        for term in meta["terms"]:
+            self._term_stats.pop(term, None)
+            plist = self._postings.get(term)
+            if plist is None:
+                continue
+            plist.pop(doc_id, None)
+            if not plist:
+                del self._postings[term]
+                self._trigrams.remove(term)
+
+    def _weighted_tf(self, tfs: Tuple[int, int]) -> float:
+        return self.title_weight * tfs[0] + self.content_weight * tfs[1]
+
+    def _stats(self, term: str) -> Tuple[float, float]:
+        stats = self._term_stats.get(term)
+        if stats is None:
+            plist = self._postings[term]
+            stats = (
+                max(self._weighted_tf(tfs) for tfs in plist.values()),
+                min(self._docs[doc_id]["field_length"] for doc_id in plist),
+            )
+            self._term_stats[term] = stats
+        return stats
+
+    def search(self, query: str, k: int = 10, ranker: str = "tf", fuzzy: bool = True) -> List[Dict[str, Any]]:
+        terms = tokenize(query)
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            weights = self._query_weights(terms, fuzzy)
+            if ranker == "bm25":
+                top = self._search_bm25(weights, k)
+            else:
+                top = self._search_tf(weights, k)
+            return [self._hit(doc_id, score, weights) for score, doc_id in top]
+
+    def _hit(self, doc_id: str, score: float, weights: Dict[str, float]) -> Dict[str, Any]:
+        meta = self._docs[doc_id]
+        positions = meta["positions"]
+        matches = sorted((start, term) for term in weights if term in positions for start in positions[term])
+        snippet, highlights = make_snippet(meta["content"], matches, weights, _TOKEN_RE)
+        return {
+            "id": doc_id,
+            "title": meta["title"],
+            "snippet": snippet,
+            "highlights": highlights,
+            "title_highlights": highlight_spans(meta["title"], weights, _TOKEN_RE),
+            "score": float(score),
+        }
+
+    def _query_weights(self, terms: List[str], fuzzy: bool) -> Dict[str, float]:
+        # Term -> query weight. A term missing from the index stands in for its closest
+        # indexed spellings, each weighted by its trigram similarity.
+        weights: Dict[str, float] = {}
+        for term in terms:
+            if term in self._postings or not fuzzy:
+                weights[term] = weights.get(term, 0.0) + 1.0
+                continue
+            for match, sim in self._trigrams.similar(term):
+                weights[match] = weights.get(match, 0.0) + sim
+        return weights
+
+    def _search_tf(self, query_counts: Dict[str, float], k: int) -> List[Tuple[float, str]]:
+        # Only the postings of the query terms are visited
+        acc: Dict[str, float] = {}
+        for term, qtf in query_counts.items():
+            for doc_id, tfs in self._postings.get(term, {}).items():
+                acc[doc_id] = acc.get(doc_id, 0) + qtf * (tfs[0] + tfs[1])
+        return heapq.nlargest(
+            k,
+            ((tf_sum / (self._docs[doc_id]["length"] + 1), doc_id) for doc_id, tf_sum in acc.items()),
+        )
+
+    def _search_bm25(self, query_counts: Dict[str, float], k: int) -> List[Tuple[float, str]]:
+        n = len(self._docs)
+        if not n:
+            return []
+        avg_length = self._total_field_length / n or 1.0
+        k1, b = self.k1, self.b
+
+        def term_score(idf: float, wtf: float, length: float) -> float:
+            return idf * wtf * (k1 + 1) / (wtf + k1 * (1 - b + b * length / avg_length))
+
+        # Per-term upper bounds from the max tf / min length seen in its postings
+        plan = []
+        for term, qtf in query_counts.items():
+            plist = self._postings.get(term)
+            if not plist:
+                continue
+            idf = qtf * math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            max_tf, min_length = self._stats(term)
+            plan.append((term_score(idf, max_tf, min_length), idf, plist))
+        plan.sort(key=lambda p: p[0], reverse=True)
+        remaining = [0.0] * (len(plan) + 1)
+        for i in range(len(plan) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + plan[i][0]
+
+        # MaxScore, term at a time: once the bounds of the terms left cannot lift an unseen
+        # document past the current k-th score, only existing candidates are scored.
+        acc: Dict[str, float] = {}
+        threshold = 0.0
+        for i, (_, idf, plist) in enumerate(plan):
+            if i and len(acc) >= k and remaining[i] <= threshold:
+                acc = {d: s for d, s in acc.items() if s + remaining[i] > threshold}
+                for doc_id in acc:
+                    tfs = plist.get(doc_id)
+                    if tfs:
+                        acc[doc_id] += term_score(idf, self._weighted_tf(tfs), self._docs[doc_id]["field_length"])
+            else:
+                for doc_id, tfs in plist.items():
+                    acc[doc_id] = acc.get(doc_id, 0.0) + term_score(idf, self._weighted_tf(tfs), self._docs[doc_id]["field_length"])
+            if len(acc) >= k:
+                threshold = heapq.nlargest(k, acc.values())[-1]
+        return heapq.nlargest(k, ((s, d) for d, s in acc.items()))
+
+
+note_index = InvertedIndex()
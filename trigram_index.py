@@ -0,0 +1,80 @@
+import math
+import os
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+# Character-trigram index over the search vocabulary, for typo-tolerant queries.
+#
+# Each term is split into padded trigrams ("  s", " st", "stu", ...) as in pg_trgm, and
+# similarity is the Jaccard overlap of two terms' trigram sets. Candidates come from the
+# postings of the query term's rarest trigrams: with similarity >= t, a term must share at
+# least m = ceil(t * |q|) trigrams, so it appears in one of the |q| - m + 1 rarest lists.
+# Only those candidates are verified; nothing scans the whole vocabulary.
+
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", 0.3))
+# Vocabulary terms a misspelled query term may expand to
+FUZZY_MAX_EXPANSIONS = int(os.getenv("FUZZY_MAX_EXPANSIONS", 3))
+# Shorter terms have too few trigrams to match on reliably
+FUZZY_MIN_LEN = 3
+
+
+def trigrams(term: str) -> FrozenSet[str]:
+    padded = f"  {term} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    def __init__(self, threshold: float = FUZZY_THRESHOLD):
+        self.threshold = threshold
+        self._grams: Dict[str, FrozenSet[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+
+    def __len__(self):
+        return len(self._grams)
+
+    def __contains__(self, term: str):
+        return term in self._grams
+
+    def add(self, term: str):
+        if term in self._grams or len(term) < FUZZY_MIN_LEN:
+            return
+        grams = trigrams(term)
+        self._grams[term] = grams
+        for g in grams:
+            self._postings.setdefault(g, set()).add(term)
+
+    def remove(self, term: str):
+        grams = self._grams.pop(term, None)
+        if grams is None:
+            return
+        for g in grams:
+            plist = self._postings.get(g)
+            if plist is None:
+                continue
+            plist.discard(term)
+            if not plist:
+                del self._postings[g]
+
+    def similar(self, term: str, threshold: float | None = None, limit: int = FUZZY_MAX_EXPANSIONS) -> List[Tuple[str, float]]:
+        """Indexed terms with trigram similarity >= threshold to term, best first."""
+        t = self.threshold if threshold is None else threshold
+        if len(term) < FUZZY_MIN_LEN or t <= 0 or limit <= 0:
+            return []
+        query = trigrams(term)
+        need = math.ceil(t * len(query))
+        lists = sorted((self._postings.get(g, ()) for g in query), key=len)
+        candidates: Set[str] = set()
+        for plist in lists[: len(query) - need + 1]:
+            candidates.update(plist)
+        # Jaccard >= t also bounds the candidate's own trigram count
+        lo, hi = t * len(query), len(query) / t
+        scored = []
+        for cand in candidates:
+            grams = self._grams[cand]
+            if cand == term or not lo <= len(grams) <= hi:
+                continue
+            shared = len(query & grams)
+            sim = shared / (len(query) + len(grams) - shared)
+            if sim >= t:
+                scored.append((sim, cand))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [(cand, sim) for sim, cand in scored[:limit]]